@@ -1,12 +1,19 @@
 import tkinter as tk
 from tkinter import messagebox
+from collections import deque
 from datetime import datetime, timedelta
 import threading
 import time
 
 class AlertSystem:
-    def __init__(self, root):
+    # root=None runs headless: notifications are queued instead of shown in a Toplevel
+    def __init__(self, root, on_notification=None, max_windows=3):
         self.root = root
+        self.on_notification = on_notification
+        self.notifications = deque(maxlen=50)
+        # open notification windows; the oldest is closed when a new one would exceed the cap
+        self.windows = deque()
+        self.max_windows = max_windows
         self.break_interval = 30 * 60
         self.posture_check_interval = 5 * 60
         self.last_break_time = datetime.now()
@@ -65,7 +72,18 @@ class AlertSystem:
         )
 
     def show_notification(self, title, message, duration=3000):
+        self.notifications.append({'title': title, 'message': message, 'timestamp': datetime.now()})
+        if self.on_notification:
+            self.on_notification(title, message)
+        if self.root is None:
+            return
+
+        while len(self.windows) >= self.max_windows:
+            self._close_window(self.windows[0])
+
         notification = tk.Toplevel(self.root)
+        self.windows.append(notification)
+        notification.protocol("WM_DELETE_WINDOW", lambda: self._close_window(notification))
         notification.title(title)
         notification.geometry("350x200")
         notification.resizable(False, False)
@@ -106,7 +124,7 @@ class AlertSystem:
         close_button = tk.Button(
             message_frame,
             text="OK",
-            command=notification.destroy,
+            command=lambda: self._close_window(notification),
             bg='#2196F3',
             fg='white',
             font=('Arial', 10, 'bold'),
@@ -115,7 +133,12 @@ class AlertSystem:
         )
         close_button.pack(pady=5)
 
-        notification.after(duration, notification.destroy)
+        notification.after(duration, lambda: self._close_window(notification))
+
+    def _close_window(self, notification):
+        if notification in self.windows:
+            self.windows.remove(notification)
+            notification.destroy()
 
     def reset_break_timer(self):
         self.last_break_time = datetime.now()
@@ -1,53 +1,71 @@
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.figure import Figure
 from datetime import datetime, timedelta
 import numpy as np
+import pandas as pd
+
+from retention import TieredPostureStore
 
 class Analytics:
-    def __init__(self, database):
+    def __init__(self, database, store=None):
         self.db = database
+        self.store = store or TieredPostureStore(database)
+
+    def get_posture_frame(self, user_id, days=7, start=None, end=None):
+        if start is None and days is not None:
+            end = end or datetime.now()
+            start = end - timedelta(days=days)
+
+        # older ranges come from the archive or summaries; 'samples' is how many raw records a row stands for
+        data = self.store.load(user_id, start=start, end=end)
+        return pd.DataFrame(
+            {'posture_score': data['posture_score'], 'samples': data['samples']},
+            index=pd.DatetimeIndex(data['timestamp'], name='timestamp')
+        ).sort_index()
+
+    def resample_scores(self, user_id, rule='1D', days=7, how='mean'):
+        frame = self.get_posture_frame(user_id, days=days)
+        if how == 'mean':
+            weighted = (frame['posture_score'] * frame['samples']).resample(rule).sum()
+            samples = frame['samples'].resample(rule).sum()
+            return (weighted / samples.where(samples > 0)).dropna()
+        return frame['posture_score'].resample(rule).agg(how).dropna()
+
+    def get_rolling_average(self, user_id, window='1h', days=1):
+        frame = self.get_posture_frame(user_id, days=days)
+        return frame['posture_score'].rolling(window).mean()
+
+    def get_hourly_heatmap(self, user_id, days=7):
+        # 7x24 matrix of mean scores, rows are weekdays (Monday=0), columns hours of day
+        frame = self.get_posture_frame(user_id, days=days)
+        if frame.empty:
+            return np.full((7, 24), np.nan)
+
+        index = frame.index
+        grouped = frame['posture_score'].groupby([index.dayofweek, index.hour]).mean()
+        return grouped.unstack().reindex(index=range(7), columns=range(24)).to_numpy()
 
     def get_posture_trends(self, user_id, days=7):
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=days)
-
-        records = self.db.posture_records.find({
-            'user_id': user_id,
-            'timestamp': {'$gte': start_date, '$lte': end_date}
-        }).sort('timestamp', 1)
+        frame = self.get_posture_frame(user_id, days=days)
 
-        records_list = list(records)
-
-        timestamps = [r['timestamp'] for r in records_list]
-        scores = [r['posture_score'] for r in records_list]
+        timestamps = frame.index.to_pydatetime().tolist()
+        scores = frame['posture_score'].to_list()
 
         return timestamps, scores
 
     def get_daily_averages(self, user_id, days=7):
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=days)
-
-        records = self.db.posture_records.find({
-            'user_id': user_id,
-            'timestamp': {'$gte': start_date, '$lte': end_date}
-        })
+        daily = self.resample_scores(user_id, rule='1D', days=days)
 
-        daily_data = {}
-        for record in records:
-            date = record['timestamp'].date()
-            if date not in daily_data:
-                daily_data[date] = []
-            daily_data[date].append(record['posture_score'])
-
-        dates = sorted(daily_data.keys())
-        averages = [np.mean(daily_data[date]) for date in dates]
+        dates = [timestamp.date() for timestamp in daily.index]
+        averages = daily.to_list()
 
         return dates, averages
 
     def get_statistics(self, user_id):
-        records = list(self.db.get_posture_history(user_id, limit=1000))
+        scores = self.db.get_posture_history(
+            user_id, limit=1000, fields=['posture_score'], output='numpy'
+        )['posture_score']
 
-        if not records:
+        if len(scores) == 0:
             return {
                 'average_score': 0,
                 'best_score': 0,
@@ -56,20 +74,19 @@ class Analytics:
                 'good_posture_percentage': 0
             }
 
-        scores = [r['posture_score'] for r in records]
-
         return {
-            'average_score': np.mean(scores),
-            'best_score': max(scores),
-            'worst_score': min(scores),
-            'total_sessions': len(records),
-            'good_posture_percentage': (sum(1 for s in scores if s >= 70) / len(scores)) * 100
+            'average_score': float(np.mean(scores)),
+            'best_score': int(scores.max()),
+            'worst_score': int(scores.min()),
+            'total_sessions': len(scores),
+            'good_posture_percentage': float(np.count_nonzero(scores >= 70)) / len(scores) * 100
         }
 
-    def create_posture_chart(self, user_id, parent_frame, days=7):
-        dates, averages = self.get_daily_averages(user_id, days)
-
-        fig, ax = plt.subplots(figsize=(8, 4), facecolor='white')
+    def posture_chart_figure(self, dates, averages, days=7):
+        # a bare Figure is not tracked by pyplot, so it is freed with its canvas instead of
+        # accumulating for the lifetime of the process
+        fig = Figure(figsize=(8, 4), facecolor='white')
+        ax = fig.add_subplot()
 
         if dates and averages:
             date_labels = [d.strftime('%m/%d') for d in dates]
@@ -88,21 +105,14 @@ class Analytics:
         else:
             ax.text(0.5, 0.5, 'No data available', ha='center', va='center', fontsize=14)
 
-        plt.tight_layout()
-
-        canvas = FigureCanvasTkAgg(fig, master=parent_frame)
-        canvas.draw()
+        fig.tight_layout()
+        return fig
 
-        return canvas.get_tk_widget()
-
-    def create_score_distribution(self, user_id, parent_frame):
-        records = list(self.db.get_posture_history(user_id, limit=500))
-
-        fig, ax = plt.subplots(figsize=(6, 4), facecolor='white')
-
-        if records:
-            scores = [r['posture_score'] for r in records]
+    def score_distribution_figure(self, scores):
+        fig = Figure(figsize=(6, 4), facecolor='white')
+        ax = fig.add_subplot()
 
+        if len(scores):
             bins = [0, 30, 50, 70, 85, 100]
             labels = ['Poor', 'Fair', 'Good', 'Very Good', 'Excellent']
 
@@ -119,15 +129,32 @@ class Analytics:
         else:
             ax.text(0.5, 0.5, 'No data available', ha='center', va='center', fontsize=14)
 
-        plt.tight_layout()
+        fig.tight_layout()
+        return fig
+
+    def get_recent_scores(self, user_id, limit=500):
+        return self.db.get_posture_history(
+            user_id, limit=limit, fields=['posture_score'], output='numpy'
+        )['posture_score']
+
+    def create_posture_chart(self, user_id, parent_frame, days=7):
+        dates, averages = self.get_daily_averages(user_id, days)
+        return self.embed_figure(self.posture_chart_figure(dates, averages, days), parent_frame)
+
+    def create_score_distribution(self, user_id, parent_frame):
+        scores = self.get_recent_scores(user_id)
+        return self.embed_figure(self.score_distribution_figure(scores), parent_frame)
+
+    def embed_figure(self, fig, parent_frame):
+        # imported here so headless report rendering does not need Tk
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
         canvas = FigureCanvasTkAgg(fig, master=parent_frame)
         canvas.draw()
-
         return canvas.get_tk_widget()
 
-    def generate_insights(self, user_id):
-        stats = self.get_statistics(user_id)
+    def generate_insights(self, user_id, stats=None):
+        stats = stats or self.get_statistics(user_id)
         insights = []
 
         if stats['average_score'] >= 80:
@@ -0,0 +1,284 @@
+import argparse
+import json
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date, datetime
+
+import numpy as np
+from bson import decode_all
+from pymongo import ASCENDING, UpdateOne
+
+from database import Database
+from gamification import GamificationSystem, current_streak, longest_streak
+from posture_detector import score_measurements_batch
+
+BADGE_WINDOW = 500  # same window the live badge check looks at
+REVOCABLE_BADGES = ('posture_novice', 'posture_pro', 'posture_master', 'wellness_warrior',
+                    'streak_starter', 'streak_legend')
+
+RECORD_FIELDS = ['_id', 'posture_score', 'status', 'timestamp', 'neck_angle', 'shoulder_alignment',
+                 'rescored_by', 'score_before_rescore']
+
+
+def _new_state(job_id, user_id):
+    return {
+        'job_id': job_id,
+        'user_id': user_id,
+        'last_id': None,
+        'records': 0,
+        'rescored': 0,
+        'points_delta': 0,
+        'posture_points': 0,
+        'tail_good': [],
+        'max_window_good': 0,
+        'dates': [],
+        'done': False,
+    }
+
+
+def _process_chunk(docs, state, job_id, gamification, thresholds):
+    stored_scores = np.array([doc.get('posture_score', 0) for doc in docs], dtype=np.int64)
+    stored_statuses = np.array([doc.get('status', '') for doc in docs], dtype=object)
+    # a record this job already rewrote (before a crash) still remembers the score it replaced
+    original_scores = np.array([
+        doc['score_before_rescore'] if doc.get('rescored_by') == job_id else doc.get('posture_score', 0)
+        for doc in docs
+    ], dtype=np.int64)
+
+    has_measurements = np.array(['neck_angle' in doc and 'shoulder_alignment' in doc for doc in docs])
+    new_scores = stored_scores.copy()
+    new_statuses = stored_statuses.copy()
+    if has_measurements.any():
+        measured = [doc for doc in docs if 'neck_angle' in doc and 'shoulder_alignment' in doc]
+        scores, statuses = score_measurements_batch(
+            [doc['neck_angle'] for doc in measured],
+            [doc['shoulder_alignment'] for doc in measured],
+            thresholds
+        )
+        new_scores[has_measurements] = scores
+        new_statuses[has_measurements] = statuses
+
+    changed = np.flatnonzero((new_scores != stored_scores) | (new_statuses != stored_statuses))
+    requests = [
+        UpdateOne({'_id': docs[i]['_id']}, {'$set': {
+            'posture_score': int(new_scores[i]),
+            'status': str(new_statuses[i]),
+            'rescored_by': job_id,
+            'score_before_rescore': int(original_scores[i]),
+        }})
+        for i in changed
+    ]
+
+    new_points = int(gamification.posture_points(new_scores).sum())
+    state['points_delta'] += new_points - int(gamification.posture_points(original_scores).sum())
+    state['posture_points'] = state.get('posture_points', 0) + new_points
+
+    # max good-posture count over any BADGE_WINDOW consecutive records, carried across chunks
+    tail = np.array(state['tail_good'], dtype=np.int64)
+    good = np.concatenate([tail, (new_scores >= 70).astype(np.int64)])
+    cumulative = np.concatenate([[0], np.cumsum(good)])
+    ends = np.arange(len(tail) + 1, len(good) + 1)
+    window_sums = cumulative[ends] - cumulative[np.maximum(0, ends - BADGE_WINDOW)]
+    state['max_window_good'] = max(state['max_window_good'], int(window_sums.max()))
+    state['tail_good'] = good[-(BADGE_WINDOW - 1):].tolist()
+
+    days = np.unique(np.array([doc['timestamp'] for doc in docs], dtype='datetime64[D]'))
+    state['dates'] = sorted(set(state['dates']) | {str(day) for day in days})
+
+    state['records'] += len(docs)
+    state['rescored'] += len(requests)
+    state['last_id'] = docs[-1]['_id']
+    return requests
+
+
+def _apply_gamification(db, gamification, job_id, user_id, state, revoke):
+    dates = [date.fromisoformat(day) for day in state['dates']]
+    streak = current_streak(dates)
+    longest = longest_streak(dates)
+
+    existing = db.gamification.find_one({'user_id': user_id}, {'total_points': 1, 'backfill_job': 1})
+    if existing is None:
+        # nothing to apply a delta to: store the full recomputed total (posture points plus breaks)
+        breaks = db.count_breaks(user_id, datetime.min)
+        total_points = state.get('posture_points', 0) + breaks * gamification.point_actions['break_taken']
+        db.gamification.update_one(
+            {'user_id': user_id},
+            {'$setOnInsert': {
+                'total_points': total_points,
+                'last_updated': datetime.now(),
+                'history': [],
+                'current_streak': streak,
+                'longest_streak': longest,
+                'backfill_job': job_id,
+            }},
+            upsert=True
+        )
+    else:
+        # the backfill_job guard makes the $inc apply once per job even if this step is retried
+        db.gamification.update_one(
+            {'user_id': user_id, 'backfill_job': {'$ne': job_id}},
+            {'$inc': {'total_points': state['points_delta']},
+             '$set': {'current_streak': streak, 'longest_streak': longest,
+                      'backfill_job': job_id, 'last_updated': datetime.now()}}
+        )
+
+    total_points = db.get_user_gamification_data(user_id, fields=['total_points']).get('total_points', 0)
+    eligible = set(gamification.eligible_badges(total_points, state['max_window_good'], longest))
+    existing_names = {b['badge_name'] for b in db.get_user_badges(user_id, fields=['badge_name'])}
+
+    revoked = []
+    awarded = db.award_badges(user_id, [
+        (gamification.badges[key]['name'], gamification.badges[key]['description'])
+        for key in eligible if gamification.badges[key]['name'] not in existing_names
+    ])
+
+    if revoke:
+        stale = [gamification.badges[key]['name'] for key in REVOCABLE_BADGES
+                 if key not in eligible and gamification.badges[key]['name'] in existing_names]
+        if stale:
+            db.achievements.delete_many({'user_id': user_id, 'badge_name': {'$in': stale}})
+            gamification.forget_badges(user_id)
+            revoked = stale
+
+    return awarded, revoked
+
+
+def backfill_user(job_id, user_id, chunk_size=5000, thresholds=None, revoke=False, dry_run=False):
+    # runs in a worker process, which builds its own client
+    db = Database()
+    gamification = GamificationSystem(db)
+    checkpoints = db.db.backfill_checkpoints
+    started = time.perf_counter()
+
+    try:
+        state = checkpoints.find_one({'job_id': job_id, 'user_id': user_id}, {'_id': 0})
+        if state and state.get('done'):
+            return {**state, 'skipped': True, 'seconds': 0.0}
+        state = state or _new_state(job_id, user_id)
+
+        query = {'user_id': user_id}
+        if state['last_id'] is not None:
+            query['_id'] = {'$gt': state['last_id']}
+        projection = {field: 1 for field in RECORD_FIELDS}
+
+        cursor = db.posture_records.find_raw_batches(
+            query, projection, sort=[('_id', ASCENDING)], batch_size=chunk_size
+        )
+        for batch in cursor:
+            docs = decode_all(batch)
+            if not docs:
+                continue
+            requests = _process_chunk(docs, state, job_id, gamification, thresholds)
+            if dry_run:
+                continue
+            if requests:
+                db.posture_records.bulk_write(requests, ordered=False)
+            # checkpoint after the chunk is written; a crash in between just redoes the chunk
+            checkpoints.replace_one({'job_id': job_id, 'user_id': user_id}, state, upsert=True)
+
+        awarded, revoked = [], []
+        if not dry_run:
+            awarded, revoked = _apply_gamification(db, gamification, job_id, user_id, state, revoke)
+            state['done'] = True
+            state['awarded'] = awarded
+            state['revoked'] = revoked
+            checkpoints.replace_one({'job_id': job_id, 'user_id': user_id}, state, upsert=True)
+
+        return {**state, 'awarded': awarded, 'revoked': revoked, 'skipped': False,
+                'seconds': time.perf_counter() - started}
+    finally:
+        db.close()
+
+
+def iter_user_ids(db):
+    for user in db.users.find({}, {'_id': 1}).batch_size(1000):
+        yield str(user['_id'])
+
+
+def run(job_id, user_ids, workers=4, chunk_size=5000, thresholds=None, revoke=False, dry_run=False, total=None):
+    started = time.perf_counter()
+    done = 0
+    records = 0
+    failures = 0
+
+    # spawn, not fork: MongoClient is not fork-safe
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        in_flight = {}
+        user_iter = iter(user_ids)
+
+        def fill():
+            for user_id in user_iter:
+                future = pool.submit(backfill_user, job_id, user_id, chunk_size, thresholds, revoke, dry_run)
+                in_flight[future] = user_id
+                if len(in_flight) >= workers * 2:
+                    return
+
+        fill()
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                user_id = in_flight.pop(future)
+                done += 1
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failures += 1
+                    print(f"[{done}/{total or '?'}] {user_id}: FAILED ({e}); rerun to resume")
+                    continue
+
+                records += result['records']
+                rate = records / max(time.perf_counter() - started, 1e-9)
+                if result['skipped']:
+                    print(f"[{done}/{total or '?'}] {user_id}: already done")
+                else:
+                    print(f"[{done}/{total or '?'}] {user_id}: {result['records']} records, "
+                          f"{result['rescored']} rescored, {result['points_delta']:+d} points, "
+                          f"badges +{len(result['awarded'])} -{len(result['revoked'])} "
+                          f"({result['seconds']:.1f}s; {rate:,.0f} records/s overall)")
+            fill()
+
+    print(f"Backfill {job_id}: {done} users, {records} records, {failures} failed "
+          f"in {time.perf_counter() - started:.1f}s")
+    return failures == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score posture history and recompute points, streaks and badges")
+    parser.add_argument('--job', help="job id; rerunning with the same id resumes from checkpoints")
+    parser.add_argument('--user', action='append', help="limit to these user ids (repeatable)")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--thresholds', type=json.loads, default=None,
+                        help='JSON overrides for PostureDetector.DEFAULT_THRESHOLDS, e.g. \'{"neck_fair": 165}\'')
+    parser.add_argument('--revoke', action='store_true', help="remove badges the user no longer qualifies for")
+    parser.add_argument('--dry-run', action='store_true', help="compute and report without writing")
+    parser.add_argument('--dedupe-badges', action='store_true',
+                        help="delete duplicate badges (keeping the earliest), build the unique index and exit")
+    args = parser.parse_args()
+    if not args.job and not args.dedupe_badges:
+        parser.error("--job is required")
+
+    db = Database()
+    if args.dedupe_badges:
+        try:
+            print(f"Removed {db.dedupe_badges()} duplicate badges")
+        finally:
+            db.close()
+        raise SystemExit(0)
+
+    db.db.backfill_checkpoints.create_index([('job_id', ASCENDING), ('user_id', ASCENDING)], unique=True)
+    if args.user:
+        user_ids, total = args.user, len(args.user)
+    else:
+        total = db.users.estimated_document_count()
+        user_ids = list(iter_user_ids(db))
+    db.close()
+
+    ok = run(args.job, user_ids, args.workers, args.chunk_size, args.thresholds, args.revoke, args.dry_run, total)
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
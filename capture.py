@@ -0,0 +1,292 @@
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from metrics import metrics
+
+
+def default_backend():
+    if sys.platform.startswith('linux'):
+        return cv2.CAP_V4L2
+    if sys.platform == 'win32':
+        return cv2.CAP_DSHOW
+    if sys.platform == 'darwin':
+        return cv2.CAP_AVFOUNDATION
+    return cv2.CAP_ANY
+
+
+class CameraSource:
+    def __init__(self, index=0, width=640, height=480, fps=30, fourcc='MJPG', backend=None):
+        self.index = index
+        self.requested = {'width': width, 'height': height, 'fps': fps, 'fourcc': fourcc}
+        self.backend = default_backend() if backend is None else backend
+        self.cap = None
+        self.open()
+
+    def open(self):
+        if self.cap is not None:
+            self.cap.release()
+
+        self.cap = cv2.VideoCapture(self.index, self.backend)
+        if not self.cap.isOpened() and self.backend != cv2.CAP_ANY:
+            # the platform backend may not know this device; let OpenCV pick
+            self.cap = cv2.VideoCapture(self.index, cv2.CAP_ANY)
+
+        # FOURCC must be requested before the size, V4L2 negotiates resolution per pixel format
+        try:
+            if self.requested['fourcc']:
+                self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.requested['fourcc']))
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.requested['width'])
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.requested['height'])
+            self.cap.set(cv2.CAP_PROP_FPS, self.requested['fps'])
+            # CAP_PROP_BUFFERSIZE may not be supported on all backends; ignore failures
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        except Exception:
+            pass
+
+    def negotiated(self):
+        fourcc = int(self.cap.get(cv2.CAP_PROP_FOURCC))
+        return {
+            'width': int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            'fps': self.cap.get(cv2.CAP_PROP_FPS),
+            'fourcc': ''.join(chr((fourcc >> (8 * i)) & 0xFF) for i in range(4)) if fourcc else None,
+        }
+
+    def set_fps(self, fps):
+        self.requested['fps'] = fps
+        return self.cap.set(cv2.CAP_PROP_FPS, fps)
+
+    def isOpened(self):
+        return self.cap is not None and self.cap.isOpened()
+
+    def read(self):
+        return self.cap.read()
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+
+
+class VideoFileSource:
+    # plays a video file back at its native frame rate, looping, in place of a camera
+    def __init__(self, path, loop=True, realtime=True):
+        self.path = path
+        self.loop = loop
+        self.realtime = realtime
+        self.cap = cv2.VideoCapture(path)
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if fps and fps > 0 else 30.0
+        self.next_frame_time = time.monotonic()
+
+    def open(self):
+        self.cap.release()
+        self.cap = cv2.VideoCapture(self.path)
+
+    def negotiated(self):
+        return {
+            'width': int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            'fps': self.fps,
+            'fourcc': None,
+        }
+
+    def set_fps(self, fps):
+        # playback keeps the file's own rate; the capture thread drops frames instead
+        return False
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        if self.realtime:
+            _pace(self)
+
+        grabbed, frame = self.cap.read()
+        if not grabbed and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            grabbed, frame = self.cap.read()
+        return grabbed, frame
+
+    def release(self):
+        self.cap.release()
+
+
+class SyntheticSource:
+    # moving test pattern; exercises the pipeline with no camera or video file
+    def __init__(self, width=640, height=480, fps=30):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.frame_index = 0
+        self.next_frame_time = time.monotonic()
+        ramp = np.linspace(0, 255, width, dtype=np.uint8)
+        self.base = np.repeat(np.tile(ramp, (height, 1))[:, :, None], 3, axis=2)
+
+    def open(self):
+        pass
+
+    def negotiated(self):
+        return {'width': self.width, 'height': self.height, 'fps': self.fps, 'fourcc': None}
+
+    def set_fps(self, fps):
+        self.fps = fps
+        return True
+
+    def isOpened(self):
+        return True
+
+    def read(self):
+        _pace(self)
+        frame = np.roll(self.base, self.frame_index * 4, axis=1)
+        cv2.putText(frame, str(self.frame_index), (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+        self.frame_index += 1
+        return True, frame
+
+    def release(self):
+        pass
+
+
+def _pace(source):
+    delay = source.next_frame_time - time.monotonic()
+    if delay > 0:
+        time.sleep(delay)
+    source.next_frame_time = max(source.next_frame_time + 1.0 / source.fps, time.monotonic())
+
+
+def open_source(src, width=640, height=480, fps=30, fourcc='MJPG', backend=None):
+    # src: camera index, "synthetic" / "synthetic:WxH@FPS", or a video file path
+    if isinstance(src, int) or str(src).isdigit():
+        return CameraSource(int(src), width, height, fps, fourcc, backend)
+
+    if str(src).startswith('synthetic'):
+        _, _, spec = str(src).partition(':')
+        if spec:
+            size, _, rate = spec.partition('@')
+            width, _, height = size.partition('x')
+            return SyntheticSource(int(width), int(height), float(rate or fps))
+        return SyntheticSource(width, height, fps)
+
+    return VideoFileSource(src)
+
+
+class FrameBuffer:
+    # double buffer: the reader thread fills a fresh back frame, then swaps it to the front
+    # under the lock and bumps the sequence number. Published frames are shared by reference
+    # between consumers, so they are made read-only; anything that draws must copy first.
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.front = None
+        self.seq = 0
+
+    def publish(self, frame):
+        frame.flags.writeable = False
+        with self.condition:
+            self.front = frame
+            self.seq += 1
+            self.condition.notify_all()
+
+    def latest(self):
+        with self.condition:
+            return self.seq, self.front
+
+    def wait_newer(self, last_seq, timeout=None):
+        with self.condition:
+            if self.seq <= last_seq:
+                self.condition.wait(timeout)
+            return self.seq, self.front
+
+
+# added: threaded capture that always keeps the latest frame (drops older frames)
+class ThreadedVideoCapture:
+    def __init__(self, src=0, width=640, height=480, backend=None, fps=30, fourcc='MJPG',
+                 max_backoff=1.0, reopen_after=30):
+        self.source = open_source(src, width, height, fps, fourcc, backend)
+        self.buffer = FrameBuffer()
+        self.max_backoff = max_backoff
+        self.reopen_after = reopen_after
+        self.failures = 0
+        # requested rate: applied to the device by the reader thread, and enforced by
+        # dropping frames for backends that ignore CAP_PROP_FPS
+        self.target_fps = fps
+        self.applied_fps = fps
+        self.next_publish = 0.0
+        self.format = self._report_format()
+
+        self.running = True
+        self.thread = threading.Thread(target=self._reader, name='capture', daemon=True)
+        self.thread.start()
+
+    def negotiated(self):
+        return self.source.negotiated()
+
+    def _report_format(self):
+        # what the device actually agreed to, which can differ from the requested size/FPS/FOURCC
+        if not self.source.isOpened():
+            return None
+        negotiated = self.source.negotiated()
+        print(f"Capture format: {negotiated}")
+        return negotiated
+
+    def set_fps(self, fps):
+        self.target_fps = fps
+        return True
+
+    def isOpened(self):
+        return self.source.isOpened()
+
+    def _reader(self):
+        backoff = 0.01
+        while self.running:
+            if self.target_fps != self.applied_fps:
+                # property changes happen here so they never race an in-flight read()
+                self.applied_fps = self.target_fps
+                self.source.set_fps(self.applied_fps)
+
+            grabbed, frame = self.source.read()
+            if not grabbed:
+                # back off instead of spinning on a dead or busy device
+                self.failures += 1
+                metrics.increment('capture.read_failures')
+                if self.failures % self.reopen_after == 0:
+                    self.source.open()
+                    self.format = self._report_format()
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            backoff = 0.01
+            self.failures = 0
+
+            now = time.monotonic()
+            if now < self.next_publish:
+                continue
+            # a little slack so a device already running at the target rate isn't halved by jitter
+            self.next_publish = now + 0.8 / self.applied_fps if self.applied_fps else now
+
+            self.buffer.publish(frame)
+            metrics.mark('capture.fps')
+
+    def read(self):
+        with metrics.timer('capture.read'):
+            seq, frame = self.buffer.latest()
+            if frame is None:
+                return False, None
+            return True, frame
+
+    def read_new(self, last_seq=0, timeout=0.5):
+        # blocks until a frame newer than last_seq arrives; returns (seq, frame) or (last_seq, None)
+        seq, frame = self.buffer.wait_newer(last_seq, timeout)
+        if frame is None or seq <= last_seq:
+            return last_seq, None
+        if last_seq and seq > last_seq + 1:
+            metrics.increment('capture.dropped_frames', seq - last_seq - 1)
+        return seq, frame
+
+    def release(self):
+        self.running = False
+        self.thread.join(timeout=1)
+        self.source.release()
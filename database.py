@@ -1,33 +1,178 @@
 import os
-from pymongo import MongoClient
+import threading
+import time
+import numpy as np
+from bson import decode_all
+from pymongo import ASCENDING, DESCENDING, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
+from pymongo.write_concern import WriteConcern
 from datetime import datetime
 from dotenv import load_dotenv
 
+from metrics import timed
+
 load_dotenv()
 
+# one MongoClient per (uri, options) per process; every Database built without an
+# explicit client shares it, so Analytics/GamificationSystem consumers reuse one pool
+_shared_clients = {}
+_shared_clients_lock = threading.Lock()
+
+
+def parse_write_concern(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, WriteConcern):
+        return value
+    value = str(value)
+    if value.isdigit():
+        return WriteConcern(w=int(value))
+    return WriteConcern(w=value)
+
+
+def get_client_options():
+    options = {
+        'maxPoolSize': int(os.getenv('MONGODB_MAX_POOL_SIZE', '50')),
+        'minPoolSize': int(os.getenv('MONGODB_MIN_POOL_SIZE', '0')),
+        'serverSelectionTimeoutMS': int(os.getenv('MONGODB_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+        'connectTimeoutMS': int(os.getenv('MONGODB_CONNECT_TIMEOUT_MS', '5000')),
+    }
+    compressors = os.getenv('MONGODB_COMPRESSORS')
+    if compressors:
+        options['compressors'] = compressors
+    return options
+
+
+def get_shared_client(uri=None, **options):
+    uri = uri or os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
+    options = {**get_client_options(), **options}
+    key = (uri, tuple(sorted(options.items())))
+
+    with _shared_clients_lock:
+        entry = _shared_clients.get(key)
+        if entry is None:
+            entry = {'client': MongoClient(uri, **options), 'refs': 0}
+            _shared_clients[key] = entry
+        entry['refs'] += 1
+        return entry['client']
+
+
+def release_shared_client(client):
+    with _shared_clients_lock:
+        for key, entry in list(_shared_clients.items()):
+            if entry['client'] is client:
+                entry['refs'] -= 1
+                if entry['refs'] <= 0:
+                    del _shared_clients[key]
+                    client.close()
+                return
+
+
+# typed columnar layout for a user's posture time series
+POSTURE_DTYPE = np.dtype([('timestamp', 'datetime64[ms]'), ('posture_score', 'f4')])
+
+
+def build_projection(fields):
+    if fields is None:
+        return None
+    projection = {field: 1 for field in fields}
+    if '_id' not in projection:
+        projection['_id'] = 0
+    return projection
+
+
+def add_time_range(query, start=None, end=None, field='timestamp'):
+    if start is not None or end is not None:
+        query[field] = {}
+        if start is not None:
+            query[field]['$gte'] = start
+        if end is not None:
+            query[field]['$lte'] = end
+    return query
+
+
+def to_numpy_columns(columns):
+    arrays = {}
+    for field, values in columns.items():
+        if field in ('timestamp', 'awarded_at', 'bucket_start'):
+            arrays[field] = np.array(values, dtype='datetime64[ms]')
+        else:
+            arrays[field] = np.asarray(values)
+    return arrays
+
+
 class Database:
-    def __init__(self):
+    # posture_records is the per-frame stream and can tolerate w=1 (or w=0);
+    # badges and points should survive a primary failover
+    DEFAULT_WRITE_CONCERNS = {
+        'posture_records': os.getenv('POSTURE_WRITE_CONCERN', '1'),
+        'wellness_metrics': os.getenv('WELLNESS_WRITE_CONCERN', '1'),
+        'gamification': os.getenv('GAMIFICATION_WRITE_CONCERN', 'majority'),
+        'achievements': os.getenv('BADGE_WRITE_CONCERN', 'majority'),
+    }
+
+    # newest points history entries kept per user
+    HISTORY_LIMIT = int(os.getenv('GAMIFICATION_HISTORY_LIMIT', '500'))
+
+    # unique, so an award is an idempotent upsert
+    BADGE_KEYS = [('user_id', ASCENDING), ('badge_name', ASCENDING)]
+
+    def __init__(self, client=None, write_concerns=None):
+        self.client = None
+        self.db = None
+        self._shared_client = client is None
+
         try:
-            mongodb_uri = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
             database_name = os.getenv('DATABASE_NAME', 'mindful_work_desk')
 
-            self.client = MongoClient(mongodb_uri)
+            self.client = client if client is not None else get_shared_client()
             self.db = self.client[database_name]
 
+            concerns = {**self.DEFAULT_WRITE_CONCERNS, **(write_concerns or {})}
+
             self.users = self.db.users
-            self.posture_records = self.db.posture_records
-            self.wellness_metrics = self.db.wellness_metrics
-            self.gamification = self.db.gamification
-            self.achievements = self.db.achievements
+            self.posture_records = self._collection('posture_records', concerns)
+            self.wellness_metrics = self._collection('wellness_metrics', concerns)
+            self.gamification = self._collection('gamification', concerns)
+            self.achievements = self._collection('achievements', concerns)
 
-            print("Database connected successfully!")
+            # MongoClient connects lazily, so only report success once a server answered
+            health = self.health_check()
+            if health['ok']:
+                print(f"Database connected successfully! ({health['latency_ms']:.1f} ms)")
+                self.ensure_indexes()
+            else:
+                print(f"Database not reachable yet: {health['error']}")
 
         except Exception as e:
             print(f"Database connection error: {e}")
+            if self.client is not None and self._shared_client:
+                release_shared_client(self.client)
             self.client = None
             self.db = None
 
-    def save_posture_record(self, user_id, posture_score, status, timestamp=None):
+    def _collection(self, name, concerns):
+        write_concern = parse_write_concern(concerns.get(name))
+        if write_concern is None:
+            return self.db[name]
+        return self.db.get_collection(name, write_concern=write_concern)
+
+    def health_check(self):
+        if self.client is None:
+            return {'ok': False, 'latency_ms': None, 'error': 'no client'}
+
+        start = time.perf_counter()
+        try:
+            self.client.admin.command('ping')
+        except PyMongoError as e:
+            return {'ok': False, 'latency_ms': None, 'error': str(e)}
+        return {'ok': True, 'latency_ms': (time.perf_counter() - start) * 1000, 'error': None}
+
+    def is_connected(self):
+        return self.health_check()['ok']
+
+    @timed('db.save_posture_record')
+    def save_posture_record(self, user_id, posture_score, status, timestamp=None, measurements=None):
         if timestamp is None:
             timestamp = datetime.now()
 
@@ -37,8 +182,11 @@ class Database:
             'status': status,
             'timestamp': timestamp
         }
+        if measurements:
+            record.update(measurements)
         return self.posture_records.insert_one(record)
 
+    @timed('db.save_wellness_metric')
     def save_wellness_metric(self, user_id, metric_type, value, timestamp=None):
         if timestamp is None:
             timestamp = datetime.now()
@@ -51,62 +199,223 @@ class Database:
         }
         return self.wellness_metrics.insert_one(metric)
 
+    @timed('db.save_break')
+    def save_break(self, user_id, start, end):
+        return self.wellness_metrics.insert_one({
+            'user_id': user_id,
+            'metric_type': 'break',
+            'value': (end - start).total_seconds(),
+            'timestamp': start,
+            'end': end
+        })
+
+    def count_breaks(self, user_id, since):
+        return self.wellness_metrics.count_documents(
+            {'user_id': user_id, 'metric_type': 'break', 'timestamp': {'$gte': since}}
+        )
+
+    @timed('db.update_gamification_score')
     def update_gamification_score(self, user_id, points, action):
-        existing = self.gamification.find_one({'user_id': user_id})
-
-        if existing:
-            new_points = existing.get('total_points', 0) + points
-            self.gamification.update_one(
-                {'user_id': user_id},
-                {'$set': {
-                    'total_points': new_points,
-                    'last_updated': datetime.now()
-                },
-                '$push': {
-                    'history': {
-                        'action': action,
-                        'points': points,
-                        'timestamp': datetime.now()
-                    }
-                }}
+        # one atomic upsert; $slice keeps only the newest history entries so the document stays bounded
+        now = datetime.now()
+        self.gamification.update_one(
+            {'user_id': user_id},
+            {'$inc': {'total_points': points},
+             '$set': {'last_updated': now},
+             '$push': {'history': {
+                 '$each': [{'action': action, 'points': points, 'timestamp': now}],
+                 '$slice': -self.HISTORY_LIMIT
+             }}},
+            upsert=True
+        )
+
+    @timed('db.get_user_gamification_data')
+    def get_user_gamification_data(self, user_id, fields=None, history_limit=None):
+        projection = build_projection(fields)
+        if history_limit is not None:
+            # $slice keeps the history array off the wire
+            projection = projection or {}
+            projection['history'] = {'$slice': -history_limit}
+        return self.gamification.find_one({'user_id': user_id}, projection)
+
+    @timed('db.award_badges')
+    def award_badges(self, user_id, badges):
+        # idempotent: one upsert per (user, badge) against the unique index; returns only the
+        # names this call actually inserted, in one round trip
+        badges = list(badges)
+        if not badges:
+            return []
+
+        now = datetime.now()
+        requests = [
+            UpdateOne(
+                {'user_id': user_id, 'badge_name': name},
+                {'$setOnInsert': {'description': description, 'awarded_at': now}},
+                upsert=True
             )
-        else:
-            self.gamification.insert_one({
-                'user_id': user_id,
-                'total_points': points,
-                'last_updated': datetime.now(),
-                'history': [{
-                    'action': action,
-                    'points': points,
-                    'timestamp': datetime.now()
-                }]
-            })
-
-    def get_user_gamification_data(self, user_id):
-        return self.gamification.find_one({'user_id': user_id})
+            for name, description in badges
+        ]
+        try:
+            upserted = self.achievements.bulk_write(requests, ordered=False).upserted_ids
+        except BulkWriteError as e:
+            # a parallel writer inserted the same badge first; that badge is simply not new here
+            if any(error['code'] != 11000 for error in e.details['writeErrors']):
+                raise
+            upserted = {item['index']: item['_id'] for item in e.details.get('upserted', [])}
+
+        return [badges[index][0] for index in sorted(upserted)]
 
     def award_badge(self, user_id, badge_name, badge_description):
-        badge = {
-            'user_id': user_id,
-            'badge_name': badge_name,
-            'description': badge_description,
-            'awarded_at': datetime.now()
-        }
-        return self.achievements.insert_one(badge)
+        return bool(self.award_badges(user_id, [(badge_name, badge_description)]))
 
-    def get_user_badges(self, user_id):
-        return list(self.achievements.find({'user_id': user_id}))
+    @timed('db.get_user_badges')
+    def get_user_badges(self, user_id, fields=None):
+        return list(self.achievements.find({'user_id': user_id}, build_projection(fields)))
 
-    def get_posture_history(self, user_id, limit=100):
-        return list(self.posture_records.find({'user_id': user_id})
-                   .sort('timestamp', -1)
-                   .limit(limit))
+    @timed('db.get_posture_history')
+    def get_posture_history(self, user_id, limit=100, fields=None, start=None, end=None,
+                            output='documents', sort_direction=DESCENDING):
+        query = add_time_range({'user_id': user_id}, start, end)
+        return self._find(self.posture_records, query, fields, limit, output, sort_direction)
 
-    def get_wellness_trends(self, user_id, metric_type=None):
-        query = {'user_id': user_id}
+    @timed('db.save_wellness_buckets')
+    def save_wellness_buckets(self, docs):
+        # one upsert per (user, metric, bucket, session) so re-flushing a still-open bucket
+        # overwrites this session's totals and never another session's
+        if not docs:
+            return None
+        requests = [
+            UpdateOne(
+                {'user_id': doc['user_id'], 'metric_type': doc['metric_type'], 'timestamp': doc['timestamp'],
+                 'session_id': doc.get('session_id')},
+                {'$set': doc},
+                upsert=True
+            )
+            for doc in docs
+        ]
+        return self.wellness_metrics.bulk_write(requests, ordered=False)
+
+    @timed('db.get_wellness_trends')
+    def get_wellness_trends(self, user_id, metric_type=None, fields=None, start=None, end=None,
+                            limit=1000, output='documents', sort_direction=DESCENDING, downsample_seconds=None):
+        query = add_time_range({'user_id': user_id}, start, end)
         if metric_type:
             query['metric_type'] = metric_type
-        return list(self.wellness_metrics.find(query).sort('timestamp', -1))
+        if downsample_seconds:
+            return self._downsample_wellness(query, downsample_seconds, limit, sort_direction)
+        return self._find(self.wellness_metrics, query, fields, limit, output, sort_direction)
+
+    def _downsample_wellness(self, query, bucket_seconds, limit, sort_direction):
+        bucket_ms = int(bucket_seconds * 1000)
+        epoch_ms = {'$toLong': '$timestamp'}
+        pipeline = [
+            {'$match': query},
+            {'$group': {
+                '_id': {
+                    'metric_type': '$metric_type',
+                    'timestamp': {'$toDate': {'$subtract': [epoch_ms, {'$mod': [epoch_ms, bucket_ms]}]}},
+                },
+                'value': {'$avg': '$value'},
+                'total': {'$sum': '$value'},
+                'max': {'$max': '$value'},
+                'count': {'$sum': 1},
+            }},
+            {'$project': {
+                '_id': 0,
+                'metric_type': '$_id.metric_type',
+                'timestamp': '$_id.timestamp',
+                'value': 1, 'total': 1, 'max': 1, 'count': 1,
+            }},
+            {'$sort': {'timestamp': sort_direction}},
+        ]
+        if limit:
+            pipeline.append({'$limit': limit})
+        return list(self.wellness_metrics.aggregate(pipeline))
+
+    def _find(self, collection, query, fields, limit, output, sort_direction):
+        # output is 'documents' (list of dicts), 'columns' (dict of lists) or 'numpy' (dict of arrays)
+        sort = [('timestamp', sort_direction)]
+        if output == 'documents':
+            return list(collection.find(query, build_projection(fields), sort=sort, limit=limit or 0))
+
+        if not fields:
+            raise ValueError("fields are required for columnar output")
+
+        columns = self._find_columns(collection, query, fields, sort, limit)
+        if output == 'numpy':
+            return to_numpy_columns(columns)
+        return columns
+
+    def _find_columns(self, collection, query, fields, sort, limit):
+        columns = {field: [] for field in fields}
+        # raw batches skip the per-document SON wrapping done by a regular cursor
+        cursor = collection.find_raw_batches(query, build_projection(fields), sort=sort, limit=limit or 0)
+        for batch in cursor:
+            for doc in decode_all(batch):
+                for field in fields:
+                    columns[field].append(doc.get(field))
+        return columns
+
+    def iter_posture_chunks(self, user_id, start=None, end=None, chunk_size=10000):
+        query = add_time_range({'user_id': user_id}, start, end)
+        cursor = self.posture_records.find_raw_batches(
+            query, build_projection(['timestamp', 'posture_score']),
+            sort=[('timestamp', ASCENDING)], batch_size=chunk_size
+        )
+        for batch in cursor:
+            docs = decode_all(batch)
+            if not docs:
+                continue
+            chunk = np.empty(len(docs), dtype=POSTURE_DTYPE)
+            chunk['timestamp'] = np.array([doc['timestamp'] for doc in docs], dtype='datetime64[ms]')
+            chunk['posture_score'] = [doc.get('posture_score', 0) for doc in docs]
+            yield chunk
+
+    @timed('db.get_posture_array')
+    def get_posture_array(self, user_id, start=None, end=None, chunk_size=10000):
+        chunks = list(self.iter_posture_chunks(user_id, start, end, chunk_size))
+        if not chunks:
+            return np.empty(0, dtype=POSTURE_DTYPE)
+        return np.concatenate(chunks)
+
+    def ensure_indexes(self):
+        self.posture_records.create_index([('user_id', ASCENDING), ('timestamp', DESCENDING)])
+        # resumable per-user scans (backfill) walk a user's records in _id order
+        self.posture_records.create_index([('user_id', ASCENDING), ('_id', ASCENDING)])
+        self.wellness_metrics.create_index(
+            [('user_id', ASCENDING), ('metric_type', ASCENDING), ('timestamp', DESCENDING),
+             ('session_id', ASCENDING)])
+        self.wellness_metrics.create_index([('user_id', ASCENDING), ('timestamp', DESCENDING)])
+        self._ensure_unique_badges()
+        self.gamification.create_index([('user_id', ASCENDING)])
+        self.gamification.create_index([('total_points', DESCENDING)])
+        self.users.create_index([('username', ASCENDING)])
+
+    def _ensure_unique_badges(self):
+        # also serves per-user badge lookups, so no separate user_id index is needed
+        try:
+            self.achievements.create_index(self.BADGE_KEYS, unique=True)
+        except OperationFailure as e:
+            if e.code != 11000:
+                raise
+            # badges duplicated by the old check-then-insert path block the unique build;
+            # awards stay idempotent upserts meanwhile, but parallel sessions can race
+            print("Duplicate badges prevent the unique achievements index; "
+                  "run `python backfill.py --dedupe-badges` once to clean them up")
+
+    def dedupe_badges(self):
+        # maintenance step: keep the earliest award of each (user, badge), then build the unique index
+        duplicates = self.achievements.aggregate([
+            {'$sort': {'awarded_at': ASCENDING}},
+            {'$group': {'_id': {'user_id': '$user_id', 'badge_name': '$badge_name'},
+                        'ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+            {'$match': {'count': {'$gt': 1}}},
+        ], allowDiskUse=True)
+        removed = 0
+        for group in duplicates:
+            removed += self.achievements.delete_many({'_id': {'$in': group['ids'][1:]}}).deleted_count
+        self.achievements.create_index(self.BADGE_KEYS, unique=True)
+        return removed
 
     def create_or_get_user(self, username):
         user = self.users.find_one({'username': username})
@@ -116,7 +425,9 @@ class Database:
                 'created_at': datetime.now(),
                 'settings': {
                     'break_interval': 30,
-                    'posture_check_interval': 5
+                    'posture_check_interval': 5,
+                    # overrides for power.DEFAULT_POWER_SETTINGS
+                    'power_saving': {'enabled': True}
                 }
             }
             result = self.users.insert_one(user)
@@ -124,5 +435,7 @@ class Database:
         return user
 
     def close(self):
-        if self.client:
-            self.client.close()
+        # an explicitly injected client belongs to the caller and is left open
+        if self.client and self._shared_client:
+            release_shared_client(self.client)
+        self.client = None
@@ -1,8 +1,26 @@
+import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
+import numpy as np
+
+from metrics import timed
+
+# how long a user's cached badge set is trusted (revocations by other processes show up after
+# this) and how many users are cached at once
+BADGE_CACHE_TTL = float(os.getenv('BADGE_CACHE_TTL', '300'))
+BADGE_CACHE_SIZE = int(os.getenv('BADGE_CACHE_SIZE', '1024'))
 
 class GamificationSystem:
-    def __init__(self, database):
+    def __init__(self, database, badge_cache_ttl=BADGE_CACHE_TTL, badge_cache_size=BADGE_CACHE_SIZE):
         self.db = database
+        # badge names each user is known to hold, as user_id -> (loaded_at, names) in LRU order;
+        # kept current from award results so the per-frame check only writes when something is new
+        self.known_badges = OrderedDict()
+        self.badge_cache_ttl = badge_cache_ttl
+        self.badge_cache_size = badge_cache_size
+        self.badge_cache_lock = threading.Lock()
 
         self.badges = {
             'posture_novice': {'name': 'Posture Novice', 'description': 'Maintained good posture for 10 minutes', 'threshold': 10},
@@ -29,86 +47,145 @@ class GamificationSystem:
             return points
         return 0
 
+    @timed('gamification.check_and_award_badges')
     def check_and_award_badges(self, user_id):
-        gamification_data = self.db.get_user_gamification_data(user_id)
+        gamification_data = self.db.get_user_gamification_data(user_id, fields=['total_points'])
         if not gamification_data:
             return []
 
-        existing_badges = self.db.get_user_badges(user_id)
-        existing_badge_names = [b['badge_name'] for b in existing_badges]
-
-        new_badges = []
         total_points = gamification_data.get('total_points', 0)
 
-        if total_points >= 1000 and 'Wellness Warrior' not in existing_badge_names:
-            self.db.award_badge(user_id, 'Wellness Warrior',
-                              self.badges['wellness_warrior']['description'])
-            new_badges.append('Wellness Warrior')
+        scores = self.db.get_posture_history(
+            user_id, limit=500, fields=['posture_score'], output='numpy'
+        )['posture_score']
+        good_posture_minutes = int(np.count_nonzero(scores >= 70))
+
+        return self.award_badges(user_id, self.eligible_badges(total_points, good_posture_minutes))
+
+    def _known_badges(self, user_id):
+        now = time.monotonic()
+        with self.badge_cache_lock:
+            entry = self.known_badges.get(user_id)
+            if entry is not None and now - entry[0] < self.badge_cache_ttl:
+                self.known_badges.move_to_end(user_id)
+                return entry[1]
+
+        known = {b['badge_name'] for b in self.db.get_user_badges(user_id, fields=['badge_name'])}
+        with self.badge_cache_lock:
+            self.known_badges[user_id] = (now, known)
+            self.known_badges.move_to_end(user_id)
+            while len(self.known_badges) > self.badge_cache_size:
+                self.known_badges.popitem(last=False)
+        return known
+
+    def forget_badges(self, user_id=None):
+        # call after badges were removed, so the next check reloads them
+        with self.badge_cache_lock:
+            if user_id is None:
+                self.known_badges.clear()
+            else:
+                self.known_badges.pop(user_id, None)
 
-        posture_records = self.db.get_posture_history(user_id, limit=500)
-        good_posture_minutes = sum(1 for r in posture_records if r.get('posture_score', 0) >= 70)
+    def award_badges(self, user_id, keys):
+        known = self._known_badges(user_id)
 
-        if good_posture_minutes >= 10 and 'Posture Novice' not in existing_badge_names:
-            self.db.award_badge(user_id, 'Posture Novice',
-                              self.badges['posture_novice']['description'])
-            new_badges.append('Posture Novice')
+        candidates = [self.badges[key] for key in keys if self.badges[key]['name'] not in known]
+        if not candidates:
+            return []
 
-        if good_posture_minutes >= 60 and 'Posture Pro' not in existing_badge_names:
-            self.db.award_badge(user_id, 'Posture Pro',
-                              self.badges['posture_pro']['description'])
-            new_badges.append('Posture Pro')
+        # the upsert decides what is new, so racing sessions never award a badge twice
+        new_badges = self.db.award_badges(user_id, [(badge['name'], badge['description']) for badge in candidates])
+        known.update(badge['name'] for badge in candidates)
+        return new_badges
 
-        if good_posture_minutes >= 240 and 'Posture Master' not in existing_badge_names:
-            self.db.award_badge(user_id, 'Posture Master',
-                              self.badges['posture_master']['description'])
-            new_badges.append('Posture Master')
+    # badge rules shared by the live check and the backfill job; streak badges only when a streak is given
+    def eligible_badges(self, total_points, good_posture_minutes, streak=None):
+        eligible = []
+        if total_points >= self.badges['wellness_warrior']['threshold']:
+            eligible.append('wellness_warrior')
+        for key in ('posture_novice', 'posture_pro', 'posture_master'):
+            if good_posture_minutes >= self.badges[key]['threshold']:
+                eligible.append(key)
+        if streak is not None:
+            for key in ('streak_starter', 'streak_legend'):
+                if streak >= self.badges[key]['threshold']:
+                    eligible.append(key)
+        return eligible
+
+    def posture_points(self, scores):
+        scores = np.asarray(scores)
+        return np.where(
+            scores >= 85, self.point_actions['excellent_posture'],
+            np.where(scores >= 70, self.point_actions['good_posture'], 0)
+        )
+
+    def record_break(self, user_id, start, end):
+        self.db.save_break(user_id, start, end)
+        self.award_points(user_id, 'break_taken')
+
+        today = datetime.combine(end.date(), datetime.min.time())
+        breaks_today = self.db.count_breaks(user_id, today)
+        if breaks_today < self.badges['break_taker']['threshold']:
+            return []
 
-        return new_badges
+        return self.award_badges(user_id, ['break_taker'])
 
     def get_user_stats(self, user_id):
-        gamification_data = self.db.get_user_gamification_data(user_id)
-        badges = self.db.get_user_badges(user_id)
+        gamification_data = self.db.get_user_gamification_data(
+            user_id, fields=['total_points', 'history'], history_limit=10
+        )
+        badges = self.db.get_user_badges(user_id, fields=['badge_name', 'description', 'awarded_at'])
 
         stats = {
             'total_points': gamification_data.get('total_points', 0) if gamification_data else 0,
             'total_badges': len(badges),
             'badges': badges,
-            'recent_activity': gamification_data.get('history', [])[-10:] if gamification_data else []
+            'recent_activity': gamification_data.get('history', []) if gamification_data else []
         }
 
         return stats
 
     def calculate_streak(self, user_id):
-        posture_records = self.db.get_posture_history(user_id, limit=1000)
+        timestamps = self.db.get_posture_history(
+            user_id, limit=1000, fields=['timestamp'], output='columns'
+        )['timestamp']
 
-        if not posture_records:
+        if not timestamps:
             return 0
 
-        dates_with_activity = set()
-        for record in posture_records:
-            date = record['timestamp'].date()
-            dates_with_activity.add(date)
-
-        sorted_dates = sorted(dates_with_activity, reverse=True)
-
-        if not sorted_dates:
-            return 0
-
-        streak = 1
-        for i in range(len(sorted_dates) - 1):
-            diff = (sorted_dates[i] - sorted_dates[i + 1]).days
-            if diff == 1:
-                streak += 1
-            else:
-                break
-
-        return streak
+        return current_streak({timestamp.date() for timestamp in timestamps})
 
     def get_leaderboard_position(self, user_id):
-        all_users = list(self.db.gamification.find().sort('total_points', -1))
+        all_users = list(self.db.gamification.find({}, {'user_id': 1, '_id': 0}).sort('total_points', -1))
         position = 1
         for idx, user in enumerate(all_users):
             if user['user_id'] == user_id:
                 position = idx + 1
                 break
         return position
+
+
+def current_streak(dates):
+    sorted_dates = sorted(dates, reverse=True)
+
+    if not sorted_dates:
+        return 0
+
+    streak = 1
+    for i in range(len(sorted_dates) - 1):
+        diff = (sorted_dates[i] - sorted_dates[i + 1]).days
+        if diff == 1:
+            streak += 1
+        else:
+            break
+
+    return streak
+
+
+def longest_streak(dates):
+    sorted_dates = sorted(dates)
+    longest = streak = 1 if sorted_dates else 0
+    for previous, current in zip(sorted_dates, sorted_dates[1:]):
+        streak = streak + 1 if (current - previous).days == 1 else 1
+        longest = max(longest, streak)
+    return longest
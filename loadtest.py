@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from database import Database, get_client_options
+from gamification import GamificationSystem
+from metrics import LatencyHistogram, metrics
+from session import MonitoringSession
+
+GROWTH_COLLECTIONS = ['posture_records', 'gamification', 'achievements']
+
+
+def make_client(uri=None, in_process=False):
+    if in_process:
+        # optional: downloads and runs a throwaway mongod, so aggregations and raw batches behave like production
+        try:
+            from pymongo_inmemory import MongoClient
+        except ImportError:
+            raise SystemExit("--in-process needs the optional pymongo_inmemory package")
+        return MongoClient()
+
+    from pymongo import MongoClient
+    return MongoClient(uri or os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'), **get_client_options())
+
+
+def collection_stats(db, user_ids):
+    stats = {}
+    for name in GROWTH_COLLECTIONS:
+        try:
+            raw = db.db.command('collStats', name)
+            stats[name] = {'count': raw.get('count', 0), 'size': raw.get('size', 0),
+                           'storage_size': raw.get('storageSize', 0), 'index_size': raw.get('totalIndexSize', 0)}
+        except Exception:
+            stats[name] = {'count': db.db[name].estimated_document_count(), 'size': 0,
+                           'storage_size': 0, 'index_size': 0}
+
+    # the points history array grows with every award; track how big the per-user document gets
+    sizes = list(db.gamification.aggregate([
+        {'$match': {'user_id': {'$in': user_ids}}},
+        {'$project': {'history': {'$size': {'$ifNull': ['$history', []]}}, 'bytes': {'$bsonSize': '$$ROOT'}}},
+        {'$group': {'_id': None, 'history': {'$max': '$history'}, 'bytes': {'$max': '$bytes'}}},
+    ]))
+    stats['gamification_doc'] = {'max_history': sizes[0]['history'] if sizes else 0,
+                                 'max_bytes': sizes[0]['bytes'] if sizes else 0}
+    return stats
+
+
+class SimulatedDesk:
+    # one user producing a synthetic score stream through the real per-frame write path
+    def __init__(self, session, fps, seed):
+        self.session = session
+        self.period = 1.0 / fps
+        self.rng = np.random.default_rng(seed)
+        self.score = float(self.rng.uniform(50, 90))
+        # per-desk counters, summed after the run so the threads never share them
+        self.counters = {'frames': 0, 'errors': 0, 'late': 0}
+
+    def next_score(self):
+        # slow random walk, so good/excellent/poor streaks all occur
+        self.score = float(np.clip(self.score + self.rng.normal(0, 4), 0, 100))
+        return int(self.score)
+
+    def run(self, deadline, latency, stop):
+        counters = self.counters
+        next_tick = time.perf_counter()
+        while not stop.is_set() and time.perf_counter() < deadline:
+            score = self.next_score()
+            status = "Good Posture" if score >= 70 else "Poor Posture"
+
+            start = time.perf_counter()
+            try:
+                self.session.record(status, score, datetime.now())
+                latency.observe(time.perf_counter() - start)
+                counters['frames'] += 1
+            except Exception as e:
+                counters['errors'] += 1
+                if counters['errors'] <= 5:
+                    print(f"Write error: {e}")
+
+            next_tick += self.period
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # the write path cannot keep up with the requested FPS for this desk
+                counters['late'] += 1
+                next_tick = time.perf_counter()
+
+
+def run(users=10, fps=1.0, duration=60, uri=None, in_process=False, database_name=None, drop=False):
+    if database_name:
+        os.environ['DATABASE_NAME'] = database_name
+
+    metrics.enabled = True
+    client = make_client(uri, in_process)
+    db = Database(client=client)
+    if db.db is None:
+        raise SystemExit("Database not reachable")
+
+    gamification = GamificationSystem(db)
+    run_id = datetime.now().strftime('%Y%m%d%H%M%S')
+    user_ids = [str(db.create_or_get_user(f"loadtest-{run_id}-{i}")['_id']) for i in range(users)]
+    desks = [SimulatedDesk(MonitoringSession(db, user_id, gamification, alerts=None), fps, seed)
+             for seed, user_id in enumerate(user_ids)]
+
+    before = collection_stats(db, user_ids)
+    latency = LatencyHistogram(window=max(int(users * fps * duration), 1024))
+    stop = threading.Event()
+
+    print(f"Simulating {users} desks at {fps} FPS for {duration}s ({users * fps:.0f} frames/s offered)")
+    started = time.perf_counter()
+    deadline = started + duration
+    with ThreadPoolExecutor(max_workers=users, thread_name_prefix='loadtest') as pool:
+        futures = [pool.submit(desk.run, deadline, latency, stop) for desk in desks]
+        try:
+            for future in futures:
+                future.result()
+        except KeyboardInterrupt:
+            stop.set()
+    elapsed = time.perf_counter() - started
+    counters = {key: sum(desk.counters[key] for desk in desks) for key in ['frames', 'errors', 'late']}
+
+    after = collection_stats(db, user_ids)
+    report = {
+        'users': users,
+        'fps': fps,
+        'elapsed_s': elapsed,
+        'frames': counters['frames'],
+        'errors': counters['errors'],
+        'late_ticks': counters['late'],
+        'throughput_fps': counters['frames'] / elapsed if elapsed else 0.0,
+        'record_latency': latency.summary(),
+        'operations': metrics.snapshot()['latency'],
+        'growth': {
+            name: {key: after[name][key] - before[name][key] for key in after[name]}
+            for name in GROWTH_COLLECTIONS
+        },
+        'gamification_doc': after['gamification_doc'],
+    }
+
+    if drop:
+        for name in ['posture_records', 'gamification', 'achievements', 'wellness_metrics']:
+            db.db[name].delete_many({'user_id': {'$in': user_ids}})
+        db.users.delete_many({'username': {'$regex': f"^loadtest-{run_id}-"}})
+
+    db.close()
+    client.close()
+    return report
+
+
+def print_report(report):
+    record = report['record_latency']
+    print(f"\nFrames written: {report['frames']} in {report['elapsed_s']:.1f}s "
+          f"({report['throughput_fps']:.1f}/s, {report['errors']} errors, {report['late_ticks']} late ticks)")
+    print(f"record(): p50 {record['p50_ms']:.1f} ms  p95 {record['p95_ms']:.1f} ms  p99 {record['p99_ms']:.1f} ms")
+
+    for name, summary in sorted(report['operations'].items()):
+        print(f"  {name:<45} n={summary['count']:<8} p50 {summary['p50_ms']:.1f}  "
+              f"p95 {summary['p95_ms']:.1f}  p99 {summary['p99_ms']:.1f} ms")
+
+    print("Document growth:")
+    for name, growth in report['growth'].items():
+        print(f"  {name:<16} +{growth['count']} docs, +{growth['size'] / 1024:.1f} KiB data, "
+              f"+{growth['index_size'] / 1024:.1f} KiB indexes")
+    doc = report['gamification_doc']
+    print(f"  largest gamification doc: {doc['max_bytes'] / 1024:.1f} KiB, {doc['max_history']} history entries")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the posture/gamification write path")
+    parser.add_argument('--users', type=int, default=10, help="simulated desks")
+    parser.add_argument('--fps', type=float, default=1.0, help="records per second per desk")
+    parser.add_argument('--duration', type=float, default=60, help="seconds")
+    parser.add_argument('--uri', help="MongoDB URI (default MONGODB_URI)")
+    parser.add_argument('--in-process', action='store_true', help="throwaway mongod via pymongo_inmemory")
+    parser.add_argument('--database', default='mindful_work_desk_loadtest',
+                        help="database to write into; keep it away from real data")
+    parser.add_argument('--drop', action='store_true', help="delete the generated users and records afterwards")
+    parser.add_argument('--json', help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = run(args.users, args.fps, args.duration, args.uri, args.in_process, args.database, args.drop)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,19 @@
+import os
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
 import cv2
 from PIL import Image, ImageTk
-from datetime import datetime
-import threading
 
 from database import Database
 from posture_detector import PostureDetector
+from capture import ThreadedVideoCapture
 from gamification import GamificationSystem
 from analytics import Analytics
 from alerts import AlertSystem
+from session import MonitoringSession
+from orchestrator import MonitoringOrchestrator, TkAsyncioPump
+from metrics import metrics
+from reports import ReportGenerator
 
 class MindfulWorkDesk:
     def __init__(self, root):
@@ -19,9 +23,13 @@ class MindfulWorkDesk:
         self.root.configure(bg='#f5f5f5')
 
         self.db = Database()
-        self.posture_detector = PostureDetector()
+        self.posture_detector = PostureDetector(
+            roi_tracking=os.getenv('POSE_ROI_TRACKING', '0') == '1',
+            draw_overlay=False
+        )
         self.gamification = GamificationSystem(self.db)
         self.analytics = Analytics(self.db)
+        self.reports = ReportGenerator(self.db)
         self.alerts = AlertSystem(self.root)
 
         self.username = simpledialog.askstring("Login", "Enter your username:", parent=self.root)
@@ -30,16 +38,27 @@ class MindfulWorkDesk:
 
         self.user = self.db.create_or_get_user(self.username)
         self.user_id = str(self.user['_id'])
+        self.session = MonitoringSession(self.db, self.user_id, self.gamification, self.alerts)
+        self.session.apply_settings(self.user.get('settings'))
 
-        self.cap = None
         self.is_monitoring = False
         self.current_posture_score = 0
         self.current_posture_status = "Not monitoring"
 
+        # the pump runs before the UI is built, so panels can load their data asynchronously
+        self.loop_pump = TkAsyncioPump(self.root)
+        self.loop_pump.start()
+        self.orchestrator = None
+
         self.setup_ui()
 
-        self.update_thread = None
-        self.monitoring_active = False
+        # F2 toggles the performance overlay (needs MWD_METRICS=1)
+        self.root.bind('<F2>', self.toggle_metrics_overlay)
+
+        self.refresh_reports()
+        schedule_hour = os.getenv('REPORT_SCHEDULE_HOUR')
+        if schedule_hour:
+            self.loop_pump.loop.create_task(self.reports.nightly(lambda: [self.user_id], int(schedule_hour)))
 
     def setup_ui(self):
         main_container = tk.Frame(self.root, bg='#f5f5f5')
@@ -94,6 +113,7 @@ class MindfulWorkDesk:
         monitor_header.pack(pady=10)
 
         self.video_label = tk.Label(parent, bg='black')
+        self.video_image = None
         self.video_label.pack(pady=10, padx=10)
 
         controls_frame = tk.Frame(parent, bg='white')
@@ -174,12 +194,12 @@ class MindfulWorkDesk:
         self.stats_frame = tk.Frame(parent, bg='white')
         self.stats_frame.pack(fill='both', expand=True, padx=10, pady=10)
 
-        self.update_stats_display()
+        tk.Label(self.stats_frame, text="Loading...", font=('Arial', 10), bg='white').pack(pady=5)
 
         refresh_button = tk.Button(
             parent,
             text="Refresh Stats",
-            command=self.update_stats_display,
+            command=lambda: self.refresh_reports(force=True),
             bg='#2196F3',
             fg='white',
             font=('Arial', 10, 'bold'),
@@ -201,94 +221,96 @@ class MindfulWorkDesk:
         self.analytics_frame = tk.Frame(parent, bg='white')
         self.analytics_frame.pack(fill='both', expand=True, padx=10, pady=10)
 
-        self.update_analytics_display()
+    def refresh_reports(self, force=False):
+        self.loop_pump.loop.create_task(self._refresh_reports(force))
 
-    def start_monitoring(self):
+    async def _refresh_reports(self, force=False):
+        # stats, insights and chart data are built on the report worker; only widgets are made here
         try:
-            self.cap = cv2.VideoCapture(0)
-            if not self.cap.isOpened():
-                messagebox.showerror("Error", "Cannot access camera!")
-                return
+            report = await self.reports.get_report(self.user_id, force=force)
+        except Exception as e:
+            print(f"Error building report: {e}")
+            return
 
-            self.is_monitoring = True
-            self.monitoring_active = True
-            self.start_button.config(state='disabled')
-            self.stop_button.config(state='normal')
+        self.update_stats_display(report)
+        self.update_analytics_display(report)
 
-            self.update_thread = threading.Thread(target=self.update_video, daemon=True)
-            self.update_thread.start()
+    def start_monitoring(self):
+        self.start_button.config(state='disabled')
+        self.loop_pump.loop.create_task(self._start_monitoring())
+
+    async def _start_monitoring(self):
+        orchestrator = MonitoringOrchestrator(
+            lambda: ThreadedVideoCapture(os.getenv('CAMERA_SOURCE', '0')),
+            self.posture_detector,
+            self.session,
+            on_result=self.update_video
+        )
+        try:
+            await orchestrator.start()
+        except Exception as e:
+            await orchestrator.stop()
+            self.start_button.config(state='normal')
+            # modal dialogs spin a nested mainloop, so keep them out of the pumped event loop
+            self.root.after(0, lambda: messagebox.showerror("Error", f"Failed to start monitoring: {e}"))
+            return
 
-            messagebox.showinfo("Success", "Monitoring started!")
+        self.orchestrator = orchestrator
+        self.is_monitoring = True
+        self.stop_button.config(state='normal')
 
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to start monitoring: {e}")
+        self.root.after(0, lambda: messagebox.showinfo("Success", "Monitoring started!"))
 
     def stop_monitoring(self):
-        self.is_monitoring = False
-        self.monitoring_active = False
+        self.stop_button.config(state='disabled')
+        self.loop_pump.loop.create_task(self._stop_monitoring(notify=True))
 
-        if self.cap:
-            self.cap.release()
+    async def _stop_monitoring(self, notify=False):
+        self.is_monitoring = False
+        orchestrator, self.orchestrator = self.orchestrator, None
+        if orchestrator:
+            await orchestrator.stop()
 
         self.video_label.config(image='')
+        self.video_image = None
         self.start_button.config(state='normal')
         self.stop_button.config(state='disabled')
 
-        messagebox.showinfo("Stopped", "Monitoring stopped!")
+        if notify:
+            self.refresh_reports(force=True)
+            self.root.after(0, lambda: messagebox.showinfo("Stopped", "Monitoring stopped!"))
 
-    def update_video(self):
-        while self.monitoring_active:
-            if not self.cap or not self.cap.isOpened():
-                break
+    def update_video(self, frame, status, score):
+        self.current_posture_status = status
+        self.current_posture_score = score
 
-            ret, frame = self.cap.read()
-            if not ret:
-                continue
-
-            frame, status, score = self.posture_detector.analyze_posture(frame)
-
-            self.current_posture_status = status
-            self.current_posture_score = score
-
-            self.db.save_posture_record(
-                self.user_id,
-                score,
-                status,
-                datetime.now()
-            )
-
-            if score >= 85:
-                self.gamification.award_points(self.user_id, 'excellent_posture')
-            elif score >= 70:
-                self.gamification.award_points(self.user_id, 'good_posture')
-
-            new_badges = self.gamification.check_and_award_badges(self.user_id)
-            for badge in new_badges:
-                self.alerts.show_achievement_notification(badge)
-
-            self.alerts.check_posture_alert(score)
-            self.alerts.check_break_reminder()
-
-            frame_resized = cv2.resize(frame, (640, 480))
+        with metrics.timer('ui.render'):
+            frame_resized = self.posture_detector.render(frame, (640, 480))
+            metrics.draw_overlay(frame_resized)
             frame_rgb = cv2.cvtColor(frame_resized, cv2.COLOR_BGR2RGB)
             img = Image.fromarray(frame_rgb)
-            imgtk = ImageTk.PhotoImage(image=img)
-
-            self.video_label.imgtk = imgtk
-            self.video_label.configure(image=imgtk)
+            # paste into one PhotoImage instead of allocating a Tk image per frame
+            if self.video_image is None or (self.video_image.width(), self.video_image.height()) != img.size:
+                self.video_image = ImageTk.PhotoImage(image=img)
+                self.video_label.configure(image=self.video_image)
+            else:
+                self.video_image.paste(img)
 
             score_color = '#4CAF50' if score >= 70 else '#FF9800' if score >= 50 else '#f44336'
 
             self.status_label.config(text=status)
             self.score_label.config(text=f"{score}/100", fg=score_color)
 
-    def update_stats_display(self):
+    def toggle_metrics_overlay(self, event=None):
+        metrics.overlay = not metrics.overlay
+
+    def update_stats_display(self, report):
         for widget in self.stats_frame.winfo_children():
             widget.destroy()
 
-        stats = self.gamification.get_user_stats(self.user_id)
-        general_stats = self.analytics.get_statistics(self.user_id)
-        streak = self.gamification.calculate_streak(self.user_id)
+        stats = report['gamification']
+        general_stats = report['statistics']
+        streak = report['streak']
 
         points_card = tk.Frame(self.stats_frame, bg='#e8f5e9', relief='raised', borderwidth=2)
         points_card.pack(fill='x', pady=5)
@@ -384,7 +406,7 @@ class MindfulWorkDesk:
                     bg='#fffde7'
                 ).pack(anchor='w', padx=5, pady=2)
 
-    def update_analytics_display(self):
+    def update_analytics_display(self, report):
         for widget in self.analytics_frame.winfo_children():
             widget.destroy()
 
@@ -392,15 +414,21 @@ class MindfulWorkDesk:
         charts_frame.pack(fill='both', expand=True)
 
         try:
-            chart = self.analytics.create_posture_chart(self.user_id, charts_frame, days=7)
+            daily = report['daily']
+            chart = self.analytics.embed_figure(
+                self.analytics.posture_chart_figure(daily['dates'], daily['averages'], report['days']),
+                charts_frame
+            )
             chart.pack(side='left', fill='both', expand=True, padx=5)
 
-            dist_chart = self.analytics.create_score_distribution(self.user_id, charts_frame)
+            dist_chart = self.analytics.embed_figure(
+                self.analytics.score_distribution_figure(report['recent_scores']), charts_frame
+            )
             dist_chart.pack(side='right', fill='both', expand=True, padx=5)
         except Exception as e:
             print(f"Error creating charts: {e}")
 
-        insights = self.analytics.generate_insights(self.user_id)
+        insights = report['insights']
         if insights:
             insights_frame = tk.Frame(self.analytics_frame, bg='#e8f5e9', relief='ridge', borderwidth=2)
             insights_frame.pack(fill='x', pady=10, padx=10)
@@ -423,9 +451,9 @@ class MindfulWorkDesk:
                 ).pack(anchor='w', padx=10, pady=2)
 
     def on_closing(self):
-        self.stop_monitoring()
-        if self.cap:
-            self.cap.release()
+        self.loop_pump.run_until_complete(self._stop_monitoring())
+        self.loop_pump.close()
+        self.reports.close()
         self.posture_detector.release()
         self.db.close()
         self.root.destroy()
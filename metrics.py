@@ -0,0 +1,224 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+import numpy as np
+from dotenv import load_dotenv
+
+
+class LatencyHistogram:
+    # rolling window of recent samples; percentiles are computed on demand, not per observation.
+    # Observed from several threads at once (db writers, load test desks), so updates are locked
+    def __init__(self, window=1024):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+
+    def summary(self):
+        with self.lock:
+            samples = list(self.samples)
+            count, total = self.count, self.total
+        samples = np.fromiter(samples, dtype=float)
+        if samples.size == 0:
+            p50 = p95 = p99 = 0.0
+        else:
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        return {
+            'count': count,
+            'sum': total,
+            'p50_ms': float(p50) * 1000,
+            'p95_ms': float(p95) * 1000,
+            'p99_ms': float(p99) * 1000,
+        }
+
+
+class RateMeter:
+    def __init__(self, window=60):
+        self.times = deque(maxlen=window)
+
+    def mark(self):
+        self.times.append(time.perf_counter())
+
+    def rate(self):
+        times = list(self.times)
+        if len(times) < 2 or times[-1] == times[0]:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    def __init__(self, enabled=False, window=1024):
+        self.enabled = enabled
+        self.overlay = False
+        self.window = window
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.rates = {}
+        self.lock = threading.Lock()
+
+    def _histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, LatencyHistogram(self.window))
+        return histogram
+
+    def timer(self, name):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self._histogram(name))
+
+    def observe(self, name, seconds):
+        if self.enabled:
+            self._histogram(name).observe(seconds)
+
+    def increment(self, name, amount=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name, value):
+        if self.enabled:
+            self.gauges[name] = value
+
+    def mark(self, name):
+        if self.enabled:
+            meter = self.rates.get(name)
+            if meter is None:
+                with self.lock:
+                    meter = self.rates.setdefault(name, RateMeter())
+            meter.mark()
+
+    def snapshot(self):
+        with self.lock:
+            histograms = dict(self.histograms)
+            counters = dict(self.counters)
+            rates = dict(self.rates)
+        return {
+            'latency': {name: histogram.summary() for name, histogram in histograms.items()},
+            'counters': counters,
+            'gauges': dict(self.gauges),
+            'rates': {name: meter.rate() for name, meter in rates.items()},
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, prefix='mwd'):
+        snapshot = self.snapshot()
+        lines = []
+
+        for name, summary in snapshot['latency'].items():
+            metric = _prometheus_name(prefix, name) + '_seconds'
+            lines.append(f"# TYPE {metric} summary")
+            for quantile, key in (('0.5', 'p50_ms'), ('0.95', 'p95_ms'), ('0.99', 'p99_ms')):
+                lines.append(f'{metric}{{quantile="{quantile}"}} {summary[key] / 1000:.6f}')
+            lines.append(f"{metric}_sum {summary['sum']:.6f}")
+            lines.append(f"{metric}_count {summary['count']}")
+
+        for name, value in snapshot['counters'].items():
+            metric = _prometheus_name(prefix, name) + '_total'
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+
+        for name, value in snapshot['gauges'].items():
+            metric = _prometheus_name(prefix, name)
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+
+        for name, value in snapshot['rates'].items():
+            metric = _prometheus_name(prefix, name) + '_per_second'
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value:.3f}")
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        content = self.to_json() if path.endswith('.json') else self.to_prometheus()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def draw_overlay(self, frame):
+        if not (self.enabled and self.overlay):
+            return frame
+
+        import cv2
+
+        snapshot = self.snapshot()
+        lines = [f"{name}: {rate:.1f}/s" for name, rate in snapshot['rates'].items()]
+        lines += [
+            f"{name}: p50 {s['p50_ms']:.1f} p95 {s['p95_ms']:.1f} p99 {s['p99_ms']:.1f} ms"
+            for name, s in sorted(snapshot['latency'].items())
+        ]
+        lines += [f"{name}: {value}" for name, value in snapshot['counters'].items()]
+        lines += [f"{name}: {value}" for name, value in snapshot['gauges'].items()]
+
+        for i, line in enumerate(lines):
+            y = 18 + i * 16
+            cv2.putText(frame, line, (8, y), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 0, 0), 3, cv2.LINE_AA)
+            cv2.putText(frame, line, (8, y), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1, cv2.LINE_AA)
+        return frame
+
+
+def _prometheus_name(prefix, name):
+    return f"{prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}"
+
+
+def timed(name):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return fn(*args, **kwargs)
+            with metrics.timer(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# process-wide registry; MWD_METRICS=1 turns collection on, MWD_METRICS_FILE exports periodically.
+# database imports this module before its own load_dotenv(), so read .env here first
+load_dotenv()
+metrics = Metrics(enabled=os.getenv('MWD_METRICS', '0') == '1')
+metrics.overlay = os.getenv('MWD_METRICS_OVERLAY', '0') == '1'
+METRICS_FILE = os.getenv('MWD_METRICS_FILE')
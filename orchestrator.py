@@ -0,0 +1,255 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+
+from metrics import METRICS_FILE, metrics
+from power import DutyCycleScheduler
+
+
+class AsyncDatabaseWriter:
+    # runs blocking pymongo calls on an executor, with at most max_concurrency in flight
+    def __init__(self, executor=None, max_concurrency=4, max_pending=64):
+        self.executor = executor or ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='db')
+        self._owns_executor = executor is None
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self._semaphore = None
+        self.pending = set()
+        self.dropped = 0
+
+    async def run(self, fn, *args, **kwargs):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, partial(fn, *args, **kwargs))
+
+    def submit(self, fn, *args, callback=None, shed=True, **kwargs):
+        # fire-and-forget write; sheds load instead of queueing without bound unless shed=False
+        if shed and len(self.pending) >= self.max_pending:
+            self.dropped += 1
+            metrics.increment('db.dropped_writes')
+            return None
+
+        task = asyncio.get_running_loop().create_task(self.run(fn, *args, **kwargs))
+        self.pending.add(task)
+        metrics.set_gauge('db.pending_writes', len(self.pending))
+        task.add_done_callback(partial(self._finished, callback))
+        return task
+
+    def _finished(self, callback, task):
+        self.pending.discard(task)
+        metrics.set_gauge('db.pending_writes', len(self.pending))
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            print(f"Database write error: {error}")
+        elif callback:
+            callback(task.result())
+
+    async def drain(self):
+        if self.pending:
+            await asyncio.gather(*list(self.pending), return_exceptions=True)
+
+    def close(self):
+        if self._owns_executor:
+            self.executor.shutdown(wait=True)
+
+
+class MonitoringOrchestrator:
+    def __init__(self, capture_factory, detector, session, on_result=None, on_error=None,
+                 inference_executor=None, writer=None, process_width=640, timer_interval=1.0,
+                 wellness_flush_interval=60.0):
+        self.capture_factory = capture_factory
+        self.detector = detector
+        self.session = session
+        self.on_result = on_result
+        self.on_error = on_error
+        self.process_width = process_width
+        self.timer_interval = timer_interval
+        self.wellness_flush_interval = wellness_flush_interval
+
+        # capture gets its own thread so release() can never race an in-flight read()
+        self.capture_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='capture')
+        self.inference_executor = inference_executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix='inference')
+        self._owns_inference_executor = inference_executor is None
+        self.writer = writer or AsyncDatabaseWriter()
+        self._owns_writer = writer is None
+
+        self.scheduler = DutyCycleScheduler(session.power_settings, on_transition=self._on_power_transition)
+
+        self.capture = None
+        self.tasks = []
+        self.running = False
+        # the analyze_posture call on the (possibly shared) inference pool, if one is running
+        self._inference = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.capture = await loop.run_in_executor(self.capture_executor, self.capture_factory)
+        if not self.capture.isOpened():
+            await loop.run_in_executor(self.capture_executor, self.capture.release)
+            self.capture = None
+            raise RuntimeError("Cannot access camera!")
+        if hasattr(self.capture, 'set_fps'):
+            self.capture.set_fps(self.scheduler.capture_fps)
+
+        self.running = True
+        self.tasks = [
+            loop.create_task(self._frame_loop()),
+            loop.create_task(self._break_timer()),
+            loop.create_task(self._wellness_flusher()),
+        ]
+        if metrics.enabled and METRICS_FILE:
+            self.tasks.append(loop.create_task(self._export_metrics(METRICS_FILE)))
+
+    async def stop(self):
+        self.running = False
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+        # cancelling the frame loop does not stop a detector call already on a pool thread;
+        # wait for it so callers can release the detector afterwards
+        if self._inference is not None:
+            await asyncio.gather(asyncio.wrap_future(self._inference), return_exceptions=True)
+            self._inference = None
+
+        await self.writer.drain()
+        await self._flush_wellness()
+
+        loop = asyncio.get_running_loop()
+        if self.capture is not None:
+            await loop.run_in_executor(self.capture_executor, self.capture.release)
+            self.capture = None
+
+        self.capture_executor.shutdown(wait=True)
+        if self._owns_inference_executor:
+            self.inference_executor.shutdown(wait=True)
+        if self._owns_writer:
+            self.writer.close()
+
+    async def _next_frame(self, loop, last_seq):
+        if hasattr(self.capture, 'read_new'):
+            # sequence-numbered captures hand over each frame once, so duplicates are skipped
+            return await loop.run_in_executor(self.capture_executor, self.capture.read_new, last_seq)
+
+        grabbed, frame = await loop.run_in_executor(self.capture_executor, self.capture.read)
+        return last_seq + 1, frame if grabbed else None
+
+    async def _frame_loop(self):
+        loop = asyncio.get_running_loop()
+        last_seq = 0
+        while self.running:
+            try:
+                last_seq = await self._process_next(loop, last_seq)
+            except Exception as e:
+                # one bad frame (or a failing callback) must not end monitoring
+                print(f"Error processing frame: {e}")
+                metrics.increment('pipeline.errors')
+                if self.on_error:
+                    self.on_error(e)
+                await asyncio.sleep(0.5)
+
+    async def _process_next(self, loop, last_seq):
+        scheduler = self.scheduler
+        last_seq, frame = await self._next_frame(loop, last_seq)
+        if frame is None:
+            await asyncio.sleep(0.01)
+            return last_seq
+
+        # idle/stable states only run inference every so often; motion can wake them early
+        scheduler.observe_frame(frame)
+        if not scheduler.should_process():
+            metrics.increment('pipeline.skipped_frames')
+            return last_seq
+
+        process_width = min(self.process_width, scheduler.process_width)
+        self._inference = self.inference_executor.submit(self.detector.analyze_posture, frame, process_width)
+        frame, status, score = await asyncio.wrap_future(self._inference)
+        self._inference = None
+
+        timestamp = datetime.now()
+        if self.session.should_record(status):
+            self.writer.submit(self.session.record, status, score, timestamp, self.detector.measurements,
+                               callback=self.session.notify_badges)
+
+        break_interval = self.session.observe(
+            status, score, timestamp, self.detector.landmarks, self.detector.backend.keypoints
+        )
+        if break_interval:
+            self.writer.submit(self.session.record_break, *break_interval,
+                               callback=self.session.notify_badges, shed=False)
+        scheduler.update(score, self.session.presence.away)
+
+        metrics.mark('pipeline.fps')
+        if self.on_result:
+            self.on_result(frame, status, score)
+        return last_seq
+
+    def _on_power_transition(self, previous, state, reason):
+        print(f"Power state {previous} -> {state} ({reason})")
+        if self.capture is not None and hasattr(self.capture, 'set_fps'):
+            self.capture.set_fps(self.scheduler.capture_fps)
+
+    async def _break_timer(self):
+        while self.running:
+            await asyncio.sleep(self.timer_interval)
+            if not self.session.presence.away:
+                self.session.alerts.check_break_reminder()
+
+    async def _wellness_flusher(self):
+        while self.running:
+            await asyncio.sleep(self.wellness_flush_interval)
+            await self._flush_wellness()
+
+    async def _flush_wellness(self):
+        # buckets are collected on the loop thread, then written in one bulk_write off it
+        wellness = self.session.wellness
+        docs = wellness.collect()
+        ok = True
+        if docs:
+            try:
+                await self.writer.run(self.session.db.save_wellness_buckets, docs)
+            except Exception as e:
+                ok = False
+                print(f"Error saving wellness metrics: {e}")
+        wellness.flushed(ok)
+
+    async def _export_metrics(self, path, interval=5.0):
+        loop = asyncio.get_running_loop()
+        while self.running:
+            await asyncio.sleep(interval)
+            await loop.run_in_executor(None, metrics.write, path)
+
+
+class TkAsyncioPump:
+    # drives an asyncio loop from Tk's mainloop so coroutines and their callbacks run on the Tk thread
+    def __init__(self, root, loop=None, interval_ms=10):
+        self.root = root
+        self.loop = loop or asyncio.new_event_loop()
+        self.interval_ms = interval_ms
+        self._after_id = None
+
+    def start(self):
+        asyncio.set_event_loop(self.loop)
+        self._tick()
+
+    def _tick(self):
+        self.loop.call_soon(self.loop.stop)
+        self.loop.run_forever()
+        self._after_id = self.root.after(self.interval_ms, self._tick)
+
+    def run_until_complete(self, coro):
+        # only valid outside a pump tick, e.g. from a Tk event handler during shutdown
+        return self.loop.run_until_complete(coro)
+
+    def close(self):
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+        self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+        self.loop.close()
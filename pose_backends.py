@@ -0,0 +1,301 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+
+class Landmark:
+    __slots__ = ('x', 'y', 'visibility')
+
+    def __init__(self, x, y, visibility=1.0):
+        self.x = x
+        self.y = y
+        self.visibility = visibility
+
+
+# MediaPipe's 33-point topology, shared by the solutions API and the Tasks PoseLandmarker
+BLAZEPOSE_KEYPOINTS = {
+    'nose': 0,
+    'left_eye': 2,
+    'right_eye': 5,
+    'left_ear': 7,
+    'right_ear': 8,
+    'left_shoulder': 11,
+    'right_shoulder': 12,
+    'left_elbow': 13,
+    'right_elbow': 14,
+    'left_wrist': 15,
+    'right_wrist': 16,
+    'left_hip': 23,
+    'right_hip': 24,
+}
+
+BLAZEPOSE_CONNECTIONS = [
+    (0, 2), (2, 7), (0, 5), (5, 8), (9, 10),
+    (11, 12), (11, 13), (13, 15), (12, 14), (14, 16),
+    (11, 23), (12, 24), (23, 24), (23, 25), (24, 26), (25, 27), (26, 28),
+]
+
+# OpenPose COCO 18-point topology used by the OpenCV DNN backend
+COCO_KEYPOINTS = {
+    'nose': 0,
+    'neck': 1,
+    'right_shoulder': 2,
+    'right_elbow': 3,
+    'right_wrist': 4,
+    'left_shoulder': 5,
+    'left_elbow': 6,
+    'left_wrist': 7,
+    'right_hip': 8,
+    'left_hip': 11,
+    'right_eye': 14,
+    'left_eye': 15,
+    'right_ear': 16,
+    'left_ear': 17,
+}
+
+COCO_NUM_KEYPOINTS = 18
+
+COCO_CONNECTIONS = [
+    (1, 2), (1, 5), (2, 3), (3, 4), (5, 6), (6, 7), (1, 8), (8, 9), (9, 10),
+    (1, 11), (11, 12), (12, 13), (1, 0), (0, 14), (14, 16), (0, 15), (15, 17),
+]
+
+
+class PoseBackend:
+    # name doubles as the create_backend spec that rebuilds the same backend
+    name = 'base'
+    keypoints = BLAZEPOSE_KEYPOINTS
+    connections = BLAZEPOSE_CONNECTIONS
+    # False when a result may belong to an earlier input, which ROI cropping cannot map back
+    supports_roi = True
+
+    # returns an indexable sequence of landmarks (normalized x/y, visibility) or None
+    def process(self, image_rgb):
+        raise NotImplementedError
+
+    # drops smoothing/tracking state built on earlier inputs; called when the ROI crop changes,
+    # since that state is in the previous input's normalized coordinates
+    def reset(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class MediaPipePoseBackend(PoseBackend):
+    def __init__(self, model_complexity=0, min_detection_confidence=0.5, min_tracking_confidence=0.5):
+        import mediapipe as mp
+
+        self.name = f"mediapipe:{model_complexity}"
+        self.options = {
+            'model_complexity': model_complexity,
+            'min_detection_confidence': min_detection_confidence,
+            'min_tracking_confidence': min_tracking_confidence,
+        }
+        self.pose = mp.solutions.pose.Pose(**self.options)
+
+    def process(self, image_rgb):
+        results = self.pose.process(image_rgb)
+        if not results.pose_landmarks:
+            return None
+        return results.pose_landmarks.landmark
+
+    def reset(self):
+        # the landmark smoother and tracking crop live in the graph; a fresh graph starts clean
+        import mediapipe as mp
+
+        self.pose.close()
+        self.pose = mp.solutions.pose.Pose(**self.options)
+
+    def close(self):
+        self.pose.close()
+
+
+class PoseLandmarkerBackend(PoseBackend):
+    # MediaPipe Tasks API; LIVE_STREAM returns the most recent finished result (one frame behind)
+    def __init__(self, model_path, live_stream=False, min_detection_confidence=0.5, min_tracking_confidence=0.5):
+        import mediapipe as mp
+        from mediapipe.tasks.python import BaseOptions, vision
+
+        self.mp = mp
+        self.live_stream = live_stream
+        # live results arrive a frame late, computed on whatever crop was sent then
+        self.supports_roi = not live_stream
+        self.name = f"landmarker{'-live' if live_stream else ''}:{model_path}"
+        self.latest = None
+        self.start_time = time.monotonic()
+        self.last_timestamp_ms = -1
+
+        self.vision = vision
+        self.options = vision.PoseLandmarkerOptions(
+            base_options=BaseOptions(model_asset_path=model_path),
+            running_mode=vision.RunningMode.LIVE_STREAM if live_stream else vision.RunningMode.VIDEO,
+            min_pose_detection_confidence=min_detection_confidence,
+            min_tracking_confidence=min_tracking_confidence,
+            result_callback=self._on_result if live_stream else None
+        )
+        self.landmarker = vision.PoseLandmarker.create_from_options(self.options)
+
+    def _on_result(self, result, output_image, timestamp_ms):
+        self.latest = result.pose_landmarks[0] if result.pose_landmarks else None
+
+    def _timestamp_ms(self):
+        # both running modes require strictly increasing timestamps
+        timestamp_ms = int((time.monotonic() - self.start_time) * 1000)
+        if timestamp_ms <= self.last_timestamp_ms:
+            timestamp_ms = self.last_timestamp_ms + 1
+        self.last_timestamp_ms = timestamp_ms
+        return timestamp_ms
+
+    def process(self, image_rgb):
+        image = self.mp.Image(image_format=self.mp.ImageFormat.SRGB, data=np.ascontiguousarray(image_rgb))
+        if self.live_stream:
+            self.landmarker.detect_async(image, self._timestamp_ms())
+            latest = self.latest
+            if latest is None:
+                return None
+            # the same result can be returned for several frames; hand out copies so callers may modify them
+            return [Landmark(lm.x, lm.y, lm.visibility) for lm in latest]
+
+        result = self.landmarker.detect_for_video(image, self._timestamp_ms())
+        return result.pose_landmarks[0] if result.pose_landmarks else None
+
+    def reset(self):
+        # VIDEO mode tracks between calls too; timestamps keep increasing across the new landmarker
+        self.landmarker.close()
+        self.latest = None
+        self.landmarker = self.vision.PoseLandmarker.create_from_options(self.options)
+
+    def close(self):
+        self.landmarker.close()
+
+
+class OpenCVDnnPoseBackend(PoseBackend):
+    # OpenPose-style COCO heatmap model (ONNX, Caffe or TF) run on CPU with cv2.dnn
+    keypoints = COCO_KEYPOINTS
+    connections = COCO_CONNECTIONS
+
+    # swap_rb: OpenPose Caffe/COCO models are trained on BGR, so the RGB input is swapped back
+    def __init__(self, model_path, config_path=None, input_size=(368, 368), min_confidence=0.1, swap_rb=True):
+        self.name = f"dnn:{model_path}"
+        self.net = cv2.dnn.readNet(model_path, config_path) if config_path else cv2.dnn.readNet(model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.input_size = input_size
+        self.min_confidence = min_confidence
+        self.swap_rb = swap_rb
+
+    def process(self, image_rgb):
+        blob = cv2.dnn.blobFromImage(image_rgb, 1.0 / 255, self.input_size, (0, 0, 0),
+                                     swapRB=self.swap_rb, crop=False)
+        self.net.setInput(blob)
+        heatmaps = self.net.forward()[0]
+        map_h, map_w = heatmaps.shape[1:3]
+
+        landmarks = []
+        for index in range(COCO_NUM_KEYPOINTS):
+            _, confidence, _, point = cv2.minMaxLoc(heatmaps[index])
+            landmarks.append(Landmark(point[0] / map_w, point[1] / map_h, float(confidence)))
+
+        required = ('left_shoulder', 'right_shoulder', 'left_ear', 'left_hip')
+        if any(landmarks[self.keypoints[name]].visibility < self.min_confidence for name in required):
+            return None
+        return landmarks
+
+
+def create_backend(spec=None, target_fps=None, sample_frame=None):
+    # spec examples: "mediapipe:1", "landmarker:pose_landmarker_full.task",
+    # "landmarker-live:pose_landmarker_lite.task", "dnn:pose.onnx", "auto"
+    spec = spec or os.getenv('POSE_BACKEND', 'mediapipe:0')
+    kind, _, arg = spec.partition(':')
+
+    if kind == 'mediapipe':
+        return MediaPipePoseBackend(model_complexity=int(arg or 0))
+    if kind == 'landmarker':
+        return PoseLandmarkerBackend(arg)
+    if kind == 'landmarker-live':
+        return PoseLandmarkerBackend(arg, live_stream=True)
+    if kind == 'dnn':
+        return OpenCVDnnPoseBackend(arg)
+    if kind == 'auto':
+        target_fps = target_fps or float(os.getenv('POSE_TARGET_FPS', '15'))
+        candidates = arg.split(',') if arg else None
+        return select_backend(target_fps, candidates, sample_frame)
+    raise ValueError(f"Unknown pose backend: {spec}")
+
+
+def benchmark_frame(source=None, skip=10):
+    # a frame with a person in it: model_complexity only changes the landmark model, which
+    # MediaPipe runs only after its detector found someone, so an empty frame times every tier alike
+    path = os.getenv('POSE_BENCHMARK_IMAGE')
+    if path:
+        frame = cv2.imread(path)
+        if frame is not None:
+            return frame
+        print(f"Cannot read POSE_BENCHMARK_IMAGE {path}")
+
+    source = source if source is not None else os.getenv('CAMERA_SOURCE', '0')
+    try:
+        from capture import open_source
+        capture = open_source(source)
+    except Exception as e:
+        print(f"Cannot open {source} for the pose benchmark: {e}")
+        return None
+
+    frame = None
+    try:
+        # skip the first frames while the camera settles exposure
+        for _ in range(skip):
+            grabbed, latest = capture.read()
+            if grabbed:
+                frame = latest
+    finally:
+        capture.release()
+    return frame
+
+
+def benchmark_backend(backend, sample_frame, frames=20, warmup=5):
+    # returns FPS, or None when the backend finds no person in the sample (timing would be meaningless)
+    image_rgb = cv2.cvtColor(sample_frame, cv2.COLOR_BGR2RGB)
+
+    detected = False
+    for _ in range(warmup):
+        detected = backend.process(image_rgb) is not None or detected
+    if not detected:
+        return None
+
+    start = time.perf_counter()
+    for _ in range(frames):
+        backend.process(image_rgb)
+    elapsed = time.perf_counter() - start
+    return frames / elapsed if elapsed > 0 else float('inf')
+
+
+def select_backend(target_fps, candidates=None, sample_frame=None):
+    # candidates are ordered heaviest first; the first one that keeps up wins
+    candidates = candidates or ['mediapipe:2', 'mediapipe:1', 'mediapipe:0']
+    if sample_frame is None:
+        sample_frame = benchmark_frame()
+    if sample_frame is None:
+        print(f"No benchmark frame available; using {candidates[-1]}")
+        return create_backend(candidates[-1])
+
+    for spec in candidates[:-1]:
+        try:
+            backend = create_backend(spec)
+        except Exception as e:
+            print(f"Skipping pose backend {spec}: {e}")
+            continue
+
+        fps = benchmark_backend(backend, sample_frame)
+        if fps is None:
+            print(f"Pose backend {spec}: no person in the benchmark frame, cannot time it")
+        else:
+            print(f"Pose backend {spec}: {fps:.1f} FPS")
+            if fps >= target_fps:
+                return backend
+        backend.close()
+
+    return create_backend(candidates[-1])
@@ -1,22 +1,46 @@
 import cv2
-import mediapipe as mp
 import numpy as np
 from datetime import datetime
 
+# ThreadedVideoCapture moved to capture.py; re-exported here for existing imports
+from capture import ThreadedVideoCapture
+from metrics import metrics
+from pose_backends import create_backend
+
+NO_PERSON_STATUS = "No person detected"
+
+
 # ...existing code...
 class PostureDetector:
-    def __init__(self):
-        self.mp_pose = mp.solutions.pose
-        self.mp_drawing = mp.solutions.drawing_utils
-        # changed: use lighter model_complexity for speed
-        self.pose = self.mp_pose.Pose(
-            model_complexity=0,
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.5
-        )
+    DEFAULT_THRESHOLDS = {
+        'neck_poor': 160,
+        'neck_fair': 170,
+        'shoulder_uneven': 0.05,
+    }
+
+    # backend is a PoseBackend or a spec string for create_backend (defaults to POSE_BACKEND / mediapipe:0)
+    # draw_overlay=False (headless) skips landmark drawing entirely; render() draws at display size on demand
+    def __init__(self, backend=None, thresholds=None, roi_tracking=False, roi_padding=0.25, roi_min_visibility=0.5,
+                 draw_overlay=True):
+        self.backend = backend if hasattr(backend, 'process') else create_backend(backend)
+        self.thresholds = {**self.DEFAULT_THRESHOLDS, **(thresholds or {})}
 
         self.posture_status = "Unknown"
         self.posture_score = 0
+        self.draw_overlay = draw_overlay
+        # last detection, normalized to the full frame, and the raw measurements it was scored from
+        self.landmarks = None
+        self.measurements = None
+
+        # ROI mode: infer on a padded crop around the previous frame's landmarks
+        self.roi_tracking = roi_tracking and getattr(self.backend, 'supports_roi', True)
+        if roi_tracking and not self.roi_tracking:
+            print(f"ROI tracking disabled: {self.backend.name} returns results for earlier frames")
+        self.roi_padding = roi_padding
+        self.roi_min_visibility = roi_min_visibility
+        self.roi = None
+        # region the backend last ran on (None = full frame); its temporal state is relative to it
+        self.input_region = None
 
     # ...existing code...
     def calculate_angle(self, a, b, c):
@@ -34,79 +58,162 @@ class PostureDetector:
 
     # changed: optionally resize to process smaller frames (speeds up inference)
     def analyze_posture(self, image, process_width=640):
-        # resize while keeping aspect ratio if image is wider than target
         h, w = image.shape[:2]
-        if w > process_width:
-            scale = process_width / w
-            image_small = cv2.resize(image, (int(w*scale), int(h*scale)))
-        else:
-            image_small = image
+        roi = self.roi if self.roi_tracking else None
+
+        landmarks = self._detect(image, process_width, roi)
+        if roi is not None and landmarks is None:
+            # tracking lost: drop the ROI and retry on the full frame
+            self.roi = roi = None
+            landmarks = self._detect(image, process_width, None)
+
+        if landmarks is not None and roi is not None:
+            self._map_landmarks_to_frame(landmarks, roi, w, h)
 
-        image_rgb = cv2.cvtColor(image_small, cv2.COLOR_BGR2RGB)
-        results = self.pose.process(image_rgb)
+        if self.roi_tracking:
+            self._update_roi(landmarks, w, h)
 
-        if results.pose_landmarks:
-            landmarks = results.pose_landmarks.landmark
+        self.landmarks = landmarks
+        self.measurements = None
 
+        if landmarks is not None:
             try:
-                # landmarks are normalized to resized frame — that's fine for relative angles
-                shoulder_left = [landmarks[self.mp_pose.PoseLandmark.LEFT_SHOULDER.value].x,
-                               landmarks[self.mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-                shoulder_right = [landmarks[self.mp_pose.PoseLandmark.RIGHT_SHOULDER.value].x,
-                                landmarks[self.mp_pose.PoseLandmark.RIGHT_SHOULDER.value].y]
-                ear_left = [landmarks[self.mp_pose.PoseLandmark.LEFT_EAR.value].x,
-                          landmarks[self.mp_pose.PoseLandmark.LEFT_EAR.value].y]
-                ear_right = [landmarks[self.mp_pose.PoseLandmark.RIGHT_EAR.value].x,
-                           landmarks[self.mp_pose.PoseLandmark.RIGHT_EAR.value].y]
-                hip_left = [landmarks[self.mp_pose.PoseLandmark.LEFT_HIP.value].x,
-                          landmarks[self.mp_pose.PoseLandmark.LEFT_HIP.value].y]
-                hip_right = [landmarks[self.mp_pose.PoseLandmark.RIGHT_HIP.value].x,
-                           landmarks[self.mp_pose.PoseLandmark.RIGHT_HIP.value].y]
-
-                neck_angle = self.calculate_angle(ear_left, shoulder_left, hip_left)
-                shoulder_alignment = abs(shoulder_left[1] - shoulder_right[1])
-
-                score = 100
-
-                if neck_angle < 160 or neck_angle > 180:
-                    score -= 30
-                    self.posture_status = "Poor - Head Forward"
-                elif neck_angle < 170:
-                    score -= 15
-                    self.posture_status = "Fair - Slight Forward Head"
-                else:
-                    self.posture_status = "Good Posture"
-
-                if shoulder_alignment > 0.05:
-                    score -= 20
-                    self.posture_status += " (Shoulders Uneven)"
-
-                self.posture_score = max(0, score)
-
-                # draw landmarks on the resized image (faster). If you need original-size overlay,
-                # run drawing on the full frame after mapping coordinates.
-                self.mp_drawing.draw_landmarks(
-                    image_small,
-                    results.pose_landmarks,
-                    self.mp_pose.POSE_CONNECTIONS
-                )
-
-                # if resized, scale drawing back to original frame size
-                if image_small.shape != image.shape:
-                    image = cv2.resize(image_small, (w, h))
-                else:
-                    image = image_small
+                with metrics.timer('detector.scoring'):
+                    self.score_landmarks(landmarks)
+
+                if self.draw_overlay:
+                    # landmarks are normalized, so draw onto the full-resolution frame rather than
+                    # the downscaled copy; on a copy, since captured frames are shared read-only
+                    with metrics.timer('detector.draw'):
+                        image = image.copy()
+                        draw_landmarks(image, landmarks, self.backend.connections)
 
             except Exception as e:
                 print(f"Error analyzing posture: {e}")
                 self.posture_status = "Error"
                 self.posture_score = 0
         else:
-            self.posture_status = "No person detected"
+            self.posture_status = NO_PERSON_STATUS
             self.posture_score = 0
 
         return image, self.posture_status, self.posture_score
 
+    def _detect(self, image, process_width, roi):
+        with metrics.timer('detector.preprocess'):
+            if roi is not None:
+                x0, y0, x1, y1 = roi
+                source = image[y0:y1, x0:x1]
+            else:
+                source = image
+
+            # resize while keeping aspect ratio if image is wider than target
+            sh, sw = source.shape[:2]
+            if sw > process_width:
+                scale = process_width / sw
+                image_small = cv2.resize(source, (int(sw*scale), int(sh*scale)))
+            else:
+                image_small = source
+
+            image_rgb = cv2.cvtColor(image_small, cv2.COLOR_BGR2RGB)
+
+        if roi != self.input_region:
+            # switching between the full frame and a crop, or moving the crop, changes what the
+            # backend's normalized coordinates mean; start its smoothing/tracking over
+            self.backend.reset()
+            self.input_region = roi
+            metrics.increment('detector.backend_resets')
+
+        with metrics.timer('detector.pose_process'):
+            landmarks = self.backend.process(image_rgb)
+
+        return landmarks
+
+    def render(self, frame, size=None):
+        # one resample to display size, then landmarks drawn at that size; always a private
+        # frame, so callers can draw more overlays without touching the captured one
+        if size is not None and (frame.shape[1], frame.shape[0]) != tuple(size):
+            frame = cv2.resize(frame, tuple(size))
+        else:
+            frame = frame.copy()
+        if self.landmarks is not None:
+            with metrics.timer('detector.draw'):
+                draw_landmarks(frame, self.landmarks, self.backend.connections)
+        return frame
+
+    def _map_landmarks_to_frame(self, landmarks, roi, w, h):
+        x0, y0, x1, y1 = roi
+        crop_w, crop_h = x1 - x0, y1 - y0
+        for landmark in landmarks:
+            landmark.x = (x0 + landmark.x * crop_w) / w
+            landmark.y = (y0 + landmark.y * crop_h) / h
+
+    def _update_roi(self, landmarks, w, h):
+        if landmarks is None:
+            self.roi = None
+            return
+
+        visible = [lm for lm in landmarks if lm.visibility >= self.roi_min_visibility]
+        if len(visible) < 4:
+            self.roi = None
+            return
+
+        xs = np.array([lm.x for lm in visible]) * w
+        ys = np.array([lm.y for lm in visible]) * h
+        pad_x = (xs.max() - xs.min()) * self.roi_padding
+        pad_y = (ys.max() - ys.min()) * self.roi_padding
+        roi = (
+            max(0, int(xs.min() - pad_x)),
+            max(0, int(ys.min() - pad_y)),
+            min(w, int(xs.max() + pad_x)),
+            min(h, int(ys.max() + pad_y)),
+        )
+        if roi[2] - roi[0] < 64 or roi[3] - roi[1] < 64:
+            self.roi = None
+            return
+
+        # keep the crop still while the user is, so MediaPipe's own tracker sees a stable input
+        if self.roi is None or _box_iou(self.roi, roi) < 0.7:
+            self.roi = roi
+
+    def score_landmarks(self, landmarks):
+        # landmarks are normalized to the full frame (mapped back from the ROI crop when tracking)
+        keypoints = self.backend.keypoints
+
+        def point(name):
+            landmark = landmarks[keypoints[name]]
+            return [landmark.x, landmark.y]
+
+        shoulder_left = point('left_shoulder')
+        shoulder_right = point('right_shoulder')
+        ear_left = point('left_ear')
+        hip_left = point('left_hip')
+
+        neck_angle = self.calculate_angle(ear_left, shoulder_left, hip_left)
+        shoulder_alignment = abs(shoulder_left[1] - shoulder_right[1])
+
+        # stored with each posture record so history can be re-scored when thresholds change
+        self.measurements = {'neck_angle': float(neck_angle), 'shoulder_alignment': float(shoulder_alignment)}
+        self.posture_score, self.posture_status = self.score_measurements(neck_angle, shoulder_alignment)
+
+    def score_measurements(self, neck_angle, shoulder_alignment):
+        thresholds = self.thresholds
+        score = 100
+
+        if neck_angle < thresholds['neck_poor'] or neck_angle > 180:
+            score -= 30
+            status = "Poor - Head Forward"
+        elif neck_angle < thresholds['neck_fair']:
+            score -= 15
+            status = "Fair - Slight Forward Head"
+        else:
+            status = "Good Posture"
+
+        if shoulder_alignment > thresholds['shoulder_uneven']:
+            score -= 20
+            status += " (Shoulders Uneven)"
+
+        return max(0, score), status
+
     def get_frame(self, cap):
         ret, frame = cap.read()
         if ret:
@@ -114,45 +221,42 @@ class PostureDetector:
         return None, "No camera feed", 0
 
     def release(self):
-        self.pose.close()
-
-# added: threaded capture that always keeps the latest frame (drops older frames)
-class ThreadedVideoCapture:
-    def __init__(self, src=0, width=640, height=480, backend=cv2.CAP_DSHOW):
-        self.cap = cv2.VideoCapture(src, backend)
-        # recommend setting buffer to 1, and lower resolution for speed
-        try:
-            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
-            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
-            # CAP_PROP_BUFFERSIZE may not be supported on all backends; ignore failures
-            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-        except Exception:
-            pass
-
-        self.grabbed = False
-        self.frame = None
-        self.running = True
-        import threading
-        self.lock = threading.Lock()
-        self.thread = threading.Thread(target=self._reader, daemon=True)
-        self.thread.start()
-
-    def _reader(self):
-        while self.running:
-            grabbed, frame = self.cap.read()
-            if not grabbed:
-                continue
-            with self.lock:
-                self.grabbed = grabbed
-                self.frame = frame
-
-    def read(self):
-        with self.lock:
-            if not self.grabbed:
-                return False, None
-            return True, self.frame.copy()
+        self.backend.close()
 
-    def release(self):
-        self.running = False
-        self.thread.join(timeout=1)
-        self.cap.release()
\ No newline at end of file
+
+def score_measurements_batch(neck_angles, shoulder_alignments, thresholds=None):
+    # vectorized PostureDetector.score_measurements, for re-scoring stored history
+    thresholds = {**PostureDetector.DEFAULT_THRESHOLDS, **(thresholds or {})}
+    neck_angles = np.asarray(neck_angles, dtype=float)
+    shoulder_alignments = np.asarray(shoulder_alignments, dtype=float)
+
+    poor = (neck_angles < thresholds['neck_poor']) | (neck_angles > 180)
+    fair = ~poor & (neck_angles < thresholds['neck_fair'])
+    uneven = shoulder_alignments > thresholds['shoulder_uneven']
+
+    scores = np.maximum(0, 100 - 30 * poor - 15 * fair - 20 * uneven)
+    statuses = np.where(poor, "Poor - Head Forward", np.where(fair, "Fair - Slight Forward Head", "Good Posture"))
+    statuses = np.where(uneven, np.char.add(statuses, " (Shoulders Uneven)"), statuses)
+    return scores, statuses
+
+
+def draw_landmarks(image, landmarks, connections, min_visibility=0.5):
+    h, w = image.shape[:2]
+    points = [
+        (int(lm.x * w), int(lm.y * h)) if lm.visibility >= min_visibility else None
+        for lm in landmarks
+    ]
+    for start, end in connections:
+        if start < len(points) and end < len(points) and points[start] and points[end]:
+            cv2.line(image, points[start], points[end], (224, 224, 224), 2, cv2.LINE_AA)
+    for p in points:
+        if p:
+            cv2.circle(image, p, 3, (0, 0, 255), -1, cv2.LINE_AA)
+
+
+def _box_iou(a, b):
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    intersection = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
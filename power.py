@@ -0,0 +1,107 @@
+import time
+
+import cv2
+import numpy as np
+
+from metrics import metrics
+
+ACTIVE = 'active'
+STABLE = 'stable'
+IDLE = 'idle'
+
+# defaults for users.settings['power_saving']
+DEFAULT_POWER_SETTINGS = {
+    'enabled': True,
+    'stable_after_seconds': 120,
+    'stable_score_band': 5,
+    'motion_threshold': 6.0,
+    'active_fps': 30,
+    'active_inference_interval': 0.0,
+    'active_process_width': 640,
+    'stable_fps': 10,
+    'stable_inference_interval': 1.0,
+    'stable_process_width': 480,
+    'idle_fps': 5,
+    'idle_inference_interval': 2.0,
+    'idle_process_width': 320,
+}
+
+
+class DutyCycleScheduler:
+    # lowers capture rate, inference rate and inference resolution while the desk is empty (idle)
+    # or the user has held the same posture for a while (stable); motion or a posture change
+    # ramps straight back to full rate
+    def __init__(self, settings=None, on_transition=None):
+        self.settings = {**DEFAULT_POWER_SETTINGS, **(settings or {})}
+        self.on_transition = on_transition
+        self.state = ACTIVE
+        self.stable_since = None
+        self.reference_score = None
+        self.last_thumbnail = None
+        self.last_inference = 0.0
+        metrics.set_gauge('power.state', 0)
+
+    @property
+    def capture_fps(self):
+        return self.settings[f'{self.state}_fps']
+
+    @property
+    def inference_interval(self):
+        return self.settings[f'{self.state}_inference_interval']
+
+    @property
+    def process_width(self):
+        return self.settings[f'{self.state}_process_width']
+
+    def should_process(self, now=None):
+        now = now or time.monotonic()
+        if now - self.last_inference < self.inference_interval:
+            return False
+        self.last_inference = now
+        return True
+
+    def observe_frame(self, frame):
+        # cheap motion probe on a tiny grayscale thumbnail; runs for every captured frame
+        thumbnail = cv2.cvtColor(cv2.resize(frame, (64, 48), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        previous, self.last_thumbnail = self.last_thumbnail, thumbnail
+        if previous is None or self.state != STABLE:
+            return
+
+        motion = float(np.mean(cv2.absdiff(thumbnail, previous)))
+        if motion > self.settings['motion_threshold']:
+            self._enter(ACTIVE, f"motion {motion:.1f}")
+
+    def update(self, score, away, now=None):
+        now = now or time.monotonic()
+        # an empty desk is always throttled; 'enabled' only governs the active/stable duty cycle
+        if away:
+            self._enter(IDLE, "desk empty")
+            return
+        if self.state == IDLE:
+            self._enter(ACTIVE, "user present")
+        if not self.settings['enabled']:
+            return
+
+        band = self.settings['stable_score_band']
+        if self.reference_score is None or abs(score - self.reference_score) > band:
+            self.reference_score = score
+            self.stable_since = now
+            if self.state == STABLE:
+                self._enter(ACTIVE, "posture changed")
+            return
+
+        if self.state == ACTIVE and now - self.stable_since >= self.settings['stable_after_seconds']:
+            self._enter(STABLE, "posture stable")
+
+    def _enter(self, state, reason):
+        if state == self.state:
+            return
+        previous, self.state = self.state, state
+        if state != STABLE:
+            self.stable_since = time.monotonic()
+            self.reference_score = None
+
+        metrics.increment(f'power.transition.{previous}_to_{state}')
+        metrics.set_gauge('power.state', (ACTIVE, STABLE, IDLE).index(state))
+        if self.on_transition:
+            self.on_transition(previous, state, reason)
@@ -0,0 +1,53 @@
+from datetime import datetime
+
+PRESENT = 'present'
+AWAY = 'away'
+
+
+class PresenceTracker:
+    # debounced presence from the per-frame "person detected" signal; a short occlusion or a
+    # missed detection does not end a session, and one lucky detection does not end a break
+    def __init__(self, absent_after_seconds=10, present_after_frames=2, min_break_seconds=120):
+        self.absent_after_seconds = absent_after_seconds
+        self.present_after_frames = present_after_frames
+        self.min_break_seconds = min_break_seconds
+
+        self.state = PRESENT
+        self.missing_since = None
+        self.away_since = None
+        self.seen_frames = 0
+
+    @property
+    def away(self):
+        return self.state == AWAY
+
+    def update(self, detected, timestamp=None):
+        # returns a (start, end) break interval when the user comes back from a long enough absence
+        timestamp = timestamp or datetime.now()
+
+        if self.state == PRESENT:
+            if detected:
+                self.missing_since = None
+            elif self.missing_since is None:
+                self.missing_since = timestamp
+            elif (timestamp - self.missing_since).total_seconds() >= self.absent_after_seconds:
+                self.state = AWAY
+                self.away_since = self.missing_since
+                self.missing_since = None
+                self.seen_frames = 0
+            return None
+
+        if not detected:
+            self.seen_frames = 0
+            return None
+
+        self.seen_frames += 1
+        if self.seen_frames < self.present_after_frames:
+            return None
+
+        start, self.away_since = self.away_since, None
+        self.state = PRESENT
+        self.seen_frames = 0
+        if (timestamp - start).total_seconds() >= self.min_break_seconds:
+            return start, timestamp
+        return None
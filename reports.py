@@ -0,0 +1,262 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+
+from analytics import Analytics
+from database import Database
+from gamification import GamificationSystem
+from metrics import metrics
+
+REPORT_TTL = float(os.getenv('REPORT_CACHE_TTL', '300'))
+REPORT_DIR = os.getenv('REPORT_DIR', 'reports')
+
+
+def build_report(analytics, gamification, user_id, days=7):
+    # plain data only (no figures), so a report can come back from a worker process
+    with metrics.timer('reports.build'):
+        statistics = analytics.get_statistics(user_id)
+        dates, averages = analytics.get_daily_averages(user_id, days)
+        return {
+            'user_id': user_id,
+            'generated_at': datetime.now(),
+            'days': days,
+            'statistics': statistics,
+            'insights': analytics.generate_insights(user_id, statistics),
+            'daily': {'dates': dates, 'averages': averages},
+            'recent_scores': analytics.get_recent_scores(user_id),
+            'gamification': gamification.get_user_stats(user_id),
+            'streak': gamification.calculate_streak(user_id),
+        }
+
+
+def report_figures(analytics, report):
+    figures = [
+        analytics.posture_chart_figure(report['daily']['dates'], report['daily']['averages'], report['days']),
+        analytics.score_distribution_figure(report['recent_scores']),
+    ]
+    return [_summary_figure(report)] + figures
+
+
+def _summary_figure(report):
+    statistics = report['statistics']
+    lines = [
+        f"Posture report - generated {report['generated_at']:%Y-%m-%d %H:%M}",
+        "",
+        f"Average score: {statistics['average_score']:.1f}/100",
+        f"Best / worst: {statistics['best_score']} / {statistics['worst_score']}",
+        f"Good posture: {statistics['good_posture_percentage']:.1f}%",
+        f"Total points: {report['gamification']['total_points']}",
+        f"Badges: {report['gamification']['total_badges']}",
+        f"Current streak: {report['streak']} days",
+        "",
+    ] + [f"- {insight}" for insight in report['insights']]
+
+    fig = Figure(figsize=(8, 4), facecolor='white')
+    fig.text(0.05, 0.95, "\n".join(lines), va='top', fontsize=11, family='monospace')
+    return fig
+
+
+def render_report(analytics, report, output_dir=REPORT_DIR, fmt='pdf'):
+    # headless: Agg/PDF canvases only, never pyplot or Tk
+    os.makedirs(output_dir, exist_ok=True)
+    stamp = report['generated_at'].strftime('%Y%m%d')
+    base = os.path.join(output_dir, f"{report['user_id']}-{stamp}")
+    figures = report_figures(analytics, report)
+
+    if fmt == 'pdf':
+        path = base + '.pdf'
+        with PdfPages(path) as pdf:
+            for fig in figures:
+                pdf.savefig(fig)
+        return [path]
+
+    paths = []
+    for name, fig in zip(['summary', 'trend', 'distribution'], figures):
+        path = f"{base}-{name}.png"
+        FigureCanvasAgg(fig).print_png(path)
+        paths.append(path)
+    return paths
+
+
+# worker-process side: one client per process, reused across reports
+_worker = None
+
+
+def _worker_systems():
+    global _worker
+    if _worker is None:
+        db = Database()
+        _worker = (Analytics(db), GamificationSystem(db))
+    return _worker
+
+
+def compute_report(user_id, days=7):
+    analytics, gamification = _worker_systems()
+    return build_report(analytics, gamification, user_id, days)
+
+
+def compute_and_render(user_id, days=7, output_dir=REPORT_DIR, fmt='pdf'):
+    analytics, gamification = _worker_systems()
+    return render_report(analytics, build_report(analytics, gamification, user_id, days), output_dir, fmt)
+
+
+class ReportGenerator:
+    # builds reports off the caller's thread and caches them for ttl seconds (scheduled reports
+    # until the next scheduled run). With a database the work runs on a thread sharing its
+    # client; without one, on a spawned process pool.
+    def __init__(self, database=None, workers=1, ttl=REPORT_TTL, days=7):
+        self.ttl = ttl
+        self.days = days
+        self.cache = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+
+        if database is not None:
+            self.analytics = Analytics(database)
+            self.gamification = GamificationSystem(database)
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reports')
+        else:
+            self.analytics = None
+            self.gamification = None
+            # spawn, not fork: MongoClient is not fork-safe
+            self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def cached(self, user_id):
+        # entries are (expires_at, report)
+        entry = self.cache.get(user_id)
+        if entry and time.monotonic() < entry[0]:
+            return entry[1]
+        return None
+
+    def submit(self, user_id, force=False, ttl=None):
+        # returns a concurrent Future; concurrent requests for one user share a build
+        with self.lock:
+            report = None if force else self.cached(user_id)
+            if report is not None:
+                future = Future()
+                future.set_result(report)
+                return future
+
+            future = self.pending.get(user_id)
+            if future is not None:
+                return future
+
+            if self.analytics is not None:
+                future = self.executor.submit(build_report, self.analytics, self.gamification, user_id, self.days)
+            else:
+                future = self.executor.submit(compute_report, user_id, self.days)
+            self.pending[user_id] = future
+
+        ttl = self.ttl if ttl is None else ttl
+        future.add_done_callback(lambda done: self._finished(user_id, done, ttl))
+        return future
+
+    def _finished(self, user_id, future, ttl):
+        with self.lock:
+            self.pending.pop(user_id, None)
+            if not future.cancelled() and future.exception() is None:
+                self.cache[user_id] = (time.monotonic() + ttl, future.result())
+
+    async def get_report(self, user_id, force=False, ttl=None):
+        # resolves on the awaiting loop's thread, e.g. the Tk thread under TkAsyncioPump
+        return await asyncio.wrap_future(self.submit(user_id, force, ttl))
+
+    def invalidate(self, user_id=None):
+        with self.lock:
+            if user_id is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(user_id, None)
+
+    async def nightly(self, user_ids, hour=2, output_dir=None, fmt='pdf'):
+        # refreshes each user's cached report once a day at `hour`, optionally writing files;
+        # with a non-zero ttl the refreshed report is kept until the next run, not just ttl seconds
+        while True:
+            now = datetime.now()
+            next_run = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+            if next_run <= now:
+                next_run += timedelta(days=1)
+            await asyncio.sleep((next_run - now).total_seconds())
+
+            keep = max(self.ttl, (next_run + timedelta(days=1) - datetime.now()).total_seconds()) if self.ttl else 0
+            for user_id in user_ids():
+                try:
+                    report = await self.get_report(user_id, force=True, ttl=keep)
+                    if output_dir:
+                        await self.render(report, output_dir, fmt)
+                except Exception as e:
+                    print(f"Nightly report for {user_id} failed: {e}")
+
+    async def render(self, report, output_dir=REPORT_DIR, fmt='pdf'):
+        loop = asyncio.get_running_loop()
+        analytics = self.analytics or Analytics(None)
+        # figure building only needs the report, never the database
+        return await loop.run_in_executor(None, render_report, analytics, report, output_dir, fmt)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_user_ids(db):
+    for user in db.users.find({}, {'_id': 1}).batch_size(1000):
+        yield str(user['_id'])
+
+
+def run_bulk(user_ids, workers=4, days=7, output_dir=REPORT_DIR, fmt='pdf'):
+    started = time.perf_counter()
+    done = failures = 0
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = {pool.submit(compute_and_render, user_id, days, output_dir, fmt): user_id for user_id in user_ids}
+        for future, user_id in futures.items():
+            done += 1
+            try:
+                paths = future.result()
+                print(f"[{done}/{len(futures)}] {user_id}: {', '.join(paths)}")
+            except Exception as e:
+                failures += 1
+                print(f"[{done}/{len(futures)}] {user_id}: FAILED ({e})")
+
+    print(f"Reports: {done} users, {failures} failed in {time.perf_counter() - started:.1f}s")
+    return failures == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render weekly posture reports headlessly")
+    parser.add_argument('--user', action='append', help="user id (repeatable); default all users")
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--format', choices=['pdf', 'png'], default='pdf')
+    parser.add_argument('--output', default=REPORT_DIR)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--nightly', type=int, metavar='HOUR',
+                        help="keep running and render every user's report daily at HOUR")
+    args = parser.parse_args()
+
+    db = Database()
+    try:
+        if args.nightly is None:
+            user_ids = args.user or list(iter_user_ids(db))
+            ok = run_bulk(user_ids, args.workers, args.days, args.output, args.format)
+            raise SystemExit(0 if ok else 1)
+
+        generator = ReportGenerator(workers=args.workers, days=args.days, ttl=0)
+        try:
+            asyncio.run(generator.nightly(lambda: args.user or list(iter_user_ids(db)),
+                                          args.nightly, args.output, args.format))
+        finally:
+            generator.close()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+import argparse
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+from bson import decode_all
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+
+from database import Database
+
+RAW_RETENTION_DAYS = int(os.getenv('POSTURE_RAW_RETENTION_DAYS', '30'))
+HOURLY_RETENTION_DAYS = int(os.getenv('POSTURE_HOURLY_RETENTION_DAYS', '365'))
+ARCHIVE_DIR = os.getenv('POSTURE_ARCHIVE_DIR', 'archive')
+# archive raw data this many days before the TTL index would delete it
+ARCHIVE_MARGIN_DAYS = 2
+
+TIERED_DTYPE = np.dtype([('timestamp', 'datetime64[ms]'), ('posture_score', 'f4'), ('samples', 'i4')])
+# archived rows keep the record's ObjectId so overlapping archive runs can be deduplicated
+ARCHIVE_DTYPE = np.dtype(TIERED_DTYPE.descr + [('record_id', 'S12')])
+
+GRANULARITY_MS = {'hour': 3600 * 1000, 'day': 24 * 3600 * 1000}
+
+
+def ensure_retention_indexes(db, raw_days=RAW_RETENTION_DAYS, hourly_days=HOURLY_RETENTION_DAYS):
+    _ensure_ttl(db.db, 'posture_records', 'posture_records_ttl', raw_days * 86400)
+    db.db.posture_summaries.create_index(
+        [('user_id', ASCENDING), ('granularity', ASCENDING), ('timestamp', ASCENDING)], unique=True
+    )
+    # hourly rows expire, daily rows are kept
+    _ensure_ttl(db.db, 'posture_summaries', 'posture_summaries_hourly_ttl', hourly_days * 86400,
+                partial={'granularity': 'hour'})
+
+
+def _ensure_ttl(database, collection, name, seconds, partial=None):
+    options = {'name': name, 'expireAfterSeconds': seconds}
+    if partial:
+        options['partialFilterExpression'] = partial
+    try:
+        database[collection].create_index([('timestamp', ASCENDING)], **options)
+    except OperationFailure:
+        # the index exists with another window; collMod changes it without a rebuild
+        database.command('collMod', collection, index={'name': name, 'expireAfterSeconds': seconds})
+
+
+def _bucket_start(field, bucket_ms):
+    epoch_ms = {'$toLong': field}
+    return {'$toDate': {'$subtract': [epoch_ms, {'$mod': [epoch_ms, bucket_ms]}]}}
+
+
+def compact(db, until=None, raw_days=RAW_RETENTION_DAYS):
+    # hourly summaries from raw records, then daily summaries from hourly ones; re-running a
+    # window replaces the same summary documents, so it is safe to overlap runs
+    state = db.db.retention_state
+    until = until or datetime.now().replace(minute=0, second=0, microsecond=0)
+    watermark = (state.find_one({'_id': 'compaction'}) or {}).get('until')
+    # the first run covers whatever raw data the retention window still holds
+    since = watermark or until - timedelta(days=raw_days)
+
+    db.posture_records.aggregate([
+        {'$match': {'timestamp': {'$gte': since, '$lt': until}}},
+        {'$group': {
+            '_id': {'user_id': '$user_id', 'timestamp': _bucket_start('$timestamp', GRANULARITY_MS['hour'])},
+            'count': {'$sum': 1},
+            'sum': {'$sum': '$posture_score'},
+            'sum_sq': {'$sum': {'$multiply': ['$posture_score', '$posture_score']}},
+            'min': {'$min': '$posture_score'},
+            'max': {'$max': '$posture_score'},
+            'good_count': {'$sum': {'$cond': [{'$gte': ['$posture_score', 70]}, 1, 0]}},
+        }},
+        {'$project': _summary_projection('hour')},
+        {'$merge': {'into': 'posture_summaries', 'on': ['user_id', 'granularity', 'timestamp'],
+                    'whenMatched': 'replace', 'whenNotMatched': 'insert'}},
+    ])
+
+    day_start = datetime.combine(since.date(), datetime.min.time())
+    db.db.posture_summaries.aggregate([
+        {'$match': {'granularity': 'hour', 'timestamp': {'$gte': day_start, '$lt': until}}},
+        {'$group': {
+            '_id': {'user_id': '$user_id', 'timestamp': _bucket_start('$timestamp', GRANULARITY_MS['day'])},
+            'count': {'$sum': '$count'},
+            'sum': {'$sum': '$sum'},
+            'sum_sq': {'$sum': '$sum_sq'},
+            'min': {'$min': '$min'},
+            'max': {'$max': '$max'},
+            'good_count': {'$sum': '$good_count'},
+        }},
+        {'$project': _summary_projection('day')},
+        {'$merge': {'into': 'posture_summaries', 'on': ['user_id', 'granularity', 'timestamp'],
+                    'whenMatched': 'replace', 'whenNotMatched': 'insert'}},
+    ])
+
+    state.update_one({'_id': 'compaction'}, {'$set': {'until': until, 'ran_at': datetime.now()}}, upsert=True)
+    return since, until
+
+
+def _summary_projection(granularity):
+    return {
+        '_id': 0,
+        'user_id': '$_id.user_id',
+        'granularity': {'$literal': granularity},
+        'timestamp': '$_id.timestamp',
+        'count': 1, 'sum': 1, 'sum_sq': 1, 'min': 1, 'max': 1, 'good_count': 1,
+        'mean': {'$divide': ['$sum', '$count']},
+    }
+
+
+class PostureArchive:
+    # cold tier: per user and month, one compressed part file per archive run. Parts are
+    # written once and never rewritten; reads merge them and drop repeats by record _id.
+    def __init__(self, archive_dir=ARCHIVE_DIR, fmt='npz'):
+        self.archive_dir = archive_dir
+        self.fmt = fmt
+
+    def _month_dir(self, user_id, month):
+        return os.path.join(self.archive_dir, str(user_id), month)
+
+    def write_part(self, user_id, month, name, data):
+        if len(data) == 0:
+            return 0
+        path = os.path.join(self._month_dir(user_id, month), f"{name}.{self.fmt}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        if self.fmt == 'parquet':
+            import pandas as pd
+            pd.DataFrame({name: data[name] for name in data.dtype.names}).to_parquet(tmp_path, compression='zstd')
+        else:
+            with open(tmp_path, 'wb') as f:
+                np.savez_compressed(f, **{name: data[name] for name in data.dtype.names})
+        # a rerun of the same window replaces its part instead of adding a second copy
+        os.replace(tmp_path, path)
+        return len(data)
+
+    def _read_part(self, path):
+        if self.fmt == 'parquet':
+            import pandas as pd
+            frame = pd.read_parquet(path)
+            columns = {name: frame[name].to_numpy() for name in ARCHIVE_DTYPE.names}
+        else:
+            with np.load(path) as archive:
+                columns = {name: archive[name] for name in ARCHIVE_DTYPE.names}
+
+        data = np.empty(len(columns['timestamp']), dtype=ARCHIVE_DTYPE)
+        for name in ARCHIVE_DTYPE.names:
+            data[name] = columns[name]
+        return data
+
+    def read_month(self, user_id, month):
+        month_dir = self._month_dir(user_id, month)
+        if not os.path.isdir(month_dir):
+            return np.empty(0, dtype=TIERED_DTYPE)
+
+        parts = [self._read_part(os.path.join(month_dir, name)) for name in sorted(os.listdir(month_dir))
+                 if name.endswith('.' + self.fmt)]
+        if not parts:
+            return np.empty(0, dtype=TIERED_DTYPE)
+
+        data = np.concatenate(parts)
+        _, unique_index = np.unique(data['record_id'], return_index=True)
+        data = np.sort(data[unique_index], order='timestamp')
+        tiered = np.empty(len(data), dtype=TIERED_DTYPE)
+        for name in TIERED_DTYPE.names:
+            tiered[name] = data[name]
+        return tiered
+
+    def read(self, user_id, start, end):
+        start64, end64 = np.datetime64(start, 'ms'), np.datetime64(end, 'ms')
+        months = np.arange(start64.astype('datetime64[M]'), end64.astype('datetime64[M]') + 1)
+        parts = []
+        for month in months:
+            data = self.read_month(user_id, str(month))
+            if len(data):
+                parts.append(data[(data['timestamp'] >= start64) & (data['timestamp'] < end64)])
+        if not parts:
+            return np.empty(0, dtype=TIERED_DTYPE)
+        return np.concatenate(parts)
+
+
+def _archive_chunk(docs):
+    data = np.empty(len(docs), dtype=ARCHIVE_DTYPE)
+    data['timestamp'] = np.array([doc['timestamp'] for doc in docs], dtype='datetime64[ms]')
+    data['posture_score'] = [doc.get('posture_score', 0) for doc in docs]
+    data['samples'] = 1
+    data['record_id'] = [doc['_id'].binary for doc in docs]
+    return data
+
+
+def archive_expiring(db, archive, raw_days=RAW_RETENTION_DAYS, chunk_size=10000):
+    # copy raw records that will expire soon into the archive. Each user's window is streamed in
+    # timestamp order and every month is written once, as one part named after the window.
+    state = db.db.retention_state
+    until = datetime.now() - timedelta(days=max(raw_days - ARCHIVE_MARGIN_DAYS, 0))
+    total = 0
+
+    for user_id in db.posture_records.distinct('user_id'):
+        key = f"archive:{user_id}"
+        since = (state.find_one({'_id': key}) or {}).get('until')
+        name = f"{since or datetime(1970, 1, 1):%Y%m%dT%H%M%S}-{until:%Y%m%dT%H%M%S}"
+
+        query = {'user_id': user_id, 'timestamp': {'$lt': until}}
+        if since is not None:
+            query['timestamp']['$gte'] = since
+        cursor = db.posture_records.find_raw_batches(
+            query, {'timestamp': 1, 'posture_score': 1}, sort=[('timestamp', ASCENDING)], batch_size=chunk_size
+        )
+
+        month, pending = None, []
+        for batch in cursor:
+            docs = decode_all(batch)
+            if not docs:
+                continue
+            chunk = _archive_chunk(docs)
+            months = chunk['timestamp'].astype('datetime64[M]')
+            for chunk_month in np.unique(months):
+                if month is not None and chunk_month != month:
+                    total += archive.write_part(user_id, str(month), name, np.concatenate(pending))
+                    pending = []
+                month = chunk_month
+                pending.append(chunk[months == chunk_month])
+        if pending:
+            total += archive.write_part(user_id, str(month), name, np.concatenate(pending))
+
+        state.update_one({'_id': key}, {'$set': {'until': until, 'user_id': user_id}}, upsert=True)
+
+    return total
+
+
+class TieredPostureStore:
+    # reads a user's posture series across the raw, archive and summary tiers:
+    # raw records inside the retention window, archived raw data before that, and hourly
+    # (or daily) summaries for anything older that was never archived
+    def __init__(self, db, archive=None, raw_days=RAW_RETENTION_DAYS):
+        self.db = db
+        self.archive = archive or PostureArchive()
+        self.raw_days = raw_days
+
+    def load(self, user_id, start=None, end=None):
+        end = end or datetime.now()
+        raw_cutoff = None
+        if self.raw_days:
+            # hourly summaries cover whole hours, so the tiers meet on the hour after the
+            # retention cutoff; the hour containing it comes from its summary, never from both
+            raw_cutoff = datetime.now() - timedelta(days=self.raw_days)
+            raw_cutoff = raw_cutoff.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+
+        parts = []
+        raw_start = start
+        if raw_cutoff is not None and (start is None or start < raw_cutoff):
+            parts.extend(self._load_cold(user_id, start, min(raw_cutoff, end)))
+            raw_start = raw_cutoff
+
+        raw = self.db.get_posture_array(user_id, start=raw_start, end=end)
+        data = np.empty(len(raw), dtype=TIERED_DTYPE)
+        data['timestamp'] = raw['timestamp']
+        data['posture_score'] = raw['posture_score']
+        data['samples'] = 1
+        parts.append(data)
+
+        return np.concatenate(parts)
+
+    def _load_cold(self, user_id, start, end):
+        parts = []
+        archived_until = (self.db.db.retention_state.find_one({'_id': f"archive:{user_id}"}) or {}).get('until')
+        summary_start = start
+
+        if archived_until is not None and self.archive is not None:
+            archive_end = min(archived_until, end)
+            archive_start = start or datetime(1970, 1, 1)
+            if archive_start < archive_end:
+                parts.append(self.archive.read(user_id, archive_start, archive_end))
+                summary_start = archive_end
+
+        if summary_start is None or summary_start < end:
+            parts.append(self._load_summaries(user_id, summary_start, end))
+        return parts
+
+    def _load_summaries(self, user_id, start, end):
+        # hourly rows where they still exist, daily rows for everything before them
+        hourly = self._find_summaries(user_id, 'hour', start, end)
+        if not hourly:
+            return self._summary_array(self._find_summaries(user_id, 'day', start, end))
+
+        # switch over at a day boundary: the first (partial) hourly day comes from its daily row
+        oldest = hourly[0]['timestamp']
+        cutoff = datetime.combine(oldest.date(), datetime.min.time())
+        if cutoff != oldest:
+            cutoff += timedelta(days=1)
+
+        daily = self._find_summaries(user_id, 'day', start, cutoff) if start is None or start < cutoff else []
+        return self._summary_array(daily + [doc for doc in hourly if doc['timestamp'] >= cutoff])
+
+    def _find_summaries(self, user_id, granularity, start, end):
+        query = {'user_id': user_id, 'granularity': granularity, 'timestamp': {'$lt': end}}
+        if start is not None:
+            query['timestamp']['$gte'] = start
+        return list(self.db.db.posture_summaries.find(
+            query, {'_id': 0, 'timestamp': 1, 'mean': 1, 'count': 1}, sort=[('timestamp', ASCENDING)]
+        ))
+
+    def _summary_array(self, docs):
+        data = np.empty(len(docs), dtype=TIERED_DTYPE)
+        if docs:
+            data['timestamp'] = np.array([doc['timestamp'] for doc in docs], dtype='datetime64[ms]')
+            data['posture_score'] = [doc['mean'] for doc in docs]
+            data['samples'] = [doc['count'] for doc in docs]
+        return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retention maintenance for posture_records (run nightly)")
+    parser.add_argument('--raw-days', type=int, default=RAW_RETENTION_DAYS)
+    parser.add_argument('--hourly-days', type=int, default=HOURLY_RETENTION_DAYS)
+    parser.add_argument('--archive-dir', default=ARCHIVE_DIR)
+    parser.add_argument('--format', choices=['npz', 'parquet'], default='npz')
+    parser.add_argument('--skip-archive', action='store_true')
+    args = parser.parse_args()
+
+    db = Database()
+    try:
+        ensure_retention_indexes(db, args.raw_days, args.hourly_days)
+        since, until = compact(db, raw_days=args.raw_days)
+        print(f"Compacted posture_records from {since} to {until}")
+        if not args.skip_archive:
+            archived = archive_expiring(db, PostureArchive(args.archive_dir, args.format), args.raw_days)
+            print(f"Archived {archived} records to {args.archive_dir}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
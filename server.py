@@ -0,0 +1,233 @@
+import argparse
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+from alerts import AlertSystem
+from database import Database
+from gamification import GamificationSystem
+from metrics import metrics
+from orchestrator import AsyncDatabaseWriter, MonitoringOrchestrator
+from pose_backends import benchmark_frame, create_backend
+from capture import ThreadedVideoCapture
+from posture_detector import PostureDetector
+from session import MonitoringSession
+
+
+class DeskStream:
+    def __init__(self, name, source, database, inference_pool, writer, process_width=640, roi_tracking=False,
+                 backend=None):
+        self.name = name
+        self.source = source
+
+        self.user = database.create_or_get_user(name)
+        self.user_id = str(self.user['_id'])
+
+        self.detector = PostureDetector(backend=backend, roi_tracking=roi_tracking, draw_overlay=False)
+        self.gamification = GamificationSystem(database)
+        self.alerts = AlertSystem(None)
+        self.session = MonitoringSession(database, self.user_id, self.gamification, self.alerts)
+        self.session.apply_settings(self.user.get('settings'))
+
+        self.orchestrator = MonitoringOrchestrator(
+            partial(ThreadedVideoCapture, source),
+            self.detector,
+            self.session,
+            on_result=self._on_result,
+            on_error=self._on_error,
+            inference_executor=inference_pool,
+            writer=writer,
+            process_width=process_width
+        )
+
+        self.running = False
+        self.lock = threading.Lock()
+
+        self.status = "Not monitoring"
+        self.score = 0
+        self.frames = 0
+        self.last_update = None
+        self.frame_times = deque(maxlen=30)
+        self.error = None
+
+    async def start(self):
+        try:
+            await self.orchestrator.start()
+            self.running = True
+        except Exception as e:
+            print(f"[{self.name}] Failed to start: {e}")
+            with self.lock:
+                self.error = str(e)
+
+    async def stop(self):
+        self.running = False
+        await self.orchestrator.stop()
+        self.detector.release()
+
+    def _on_result(self, frame, status, score):
+        now = time.monotonic()
+        with self.lock:
+            self.status = status
+            self.score = score
+            self.frames += 1
+            self.last_update = datetime.now()
+            self.frame_times.append(now)
+
+    def _on_error(self, error):
+        with self.lock:
+            self.error = str(error)
+
+    def snapshot(self):
+        with self.lock:
+            fps = 0.0
+            if len(self.frame_times) > 1:
+                span = self.frame_times[-1] - self.frame_times[0]
+                fps = (len(self.frame_times) - 1) / span if span > 0 else 0.0
+
+            return {
+                'name': self.name,
+                'user_id': self.user_id,
+                'source': str(self.source),
+                'running': self.running,
+                'status': self.status,
+                'score': self.score,
+                'frames': self.frames,
+                'fps': round(fps, 2),
+                'power_state': self.orchestrator.scheduler.state,
+                'capture_format': getattr(self.orchestrator.capture, 'format', None),
+                'present': not self.session.presence.away,
+                'last_update': self.last_update.isoformat() if self.last_update else None,
+                'notifications': [
+                    {'title': n['title'], 'message': n['message'], 'timestamp': n['timestamp'].isoformat()}
+                    for n in list(self.alerts.notifications)
+                ],
+                'error': self.error,
+            }
+
+
+class MonitoringServer:
+    def __init__(self, desks, host='127.0.0.1', port=8765, workers=2, process_width=640, roi_tracking=False,
+                 backend=None):
+        if backend and backend.startswith('auto'):
+            # benchmark once, then give every desk its own instance of the chosen tier
+            # timed on a frame from the first desk, which should show someone at the desk
+            selected = create_backend(backend, sample_frame=benchmark_frame(desks[0][1]) if desks else None)
+            backend = selected.name
+            selected.close()
+
+        self.db = Database()
+        self.inference_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='inference')
+        self.writer = AsyncDatabaseWriter(max_concurrency=max(4, len(desks)), max_pending=16 * len(desks))
+        self.streams = {
+            name: DeskStream(name, source, self.db, self.inference_pool, self.writer, process_width, roi_tracking,
+                             backend)
+            for name, source in desks
+        }
+        self.http = ThreadingHTTPServer((host, port), self._make_handler())
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parts = [part for part in self.path.split('?')[0].split('/') if part]
+
+                if parts == ['health']:
+                    self._send(200, server.db.health_check())
+                elif parts == ['metrics']:
+                    self._send_text(200, metrics.to_prometheus())
+                elif parts == ['metrics.json']:
+                    self._send(200, metrics.snapshot())
+                elif parts == ['desks']:
+                    self._send(200, [stream.snapshot() for stream in server.streams.values()])
+                elif len(parts) == 2 and parts[0] == 'desks' and parts[1] in server.streams:
+                    self._send(200, server.streams[parts[1]].snapshot())
+                else:
+                    self._send(404, {'error': 'not found'})
+
+            def _send(self, code, payload):
+                self._write(code, json.dumps(payload, default=str), 'application/json')
+
+            def _send_text(self, code, text):
+                self._write(code, text, 'text/plain; version=0.0.4')
+
+            def _write(self, code, text, content_type):
+                body = text.encode('utf-8')
+                self.send_response(code)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    async def run(self):
+        for stream in self.streams.values():
+            await stream.start()
+        host, port = self.http.server_address[:2]
+        print(f"Serving {len(self.streams)} desk(s) on http://{host}:{port}")
+
+        http_thread = threading.Thread(target=self.http.serve_forever, name='http', daemon=True)
+        http_thread.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            self.http.shutdown()
+            self.http.server_close()
+            for stream in self.streams.values():
+                await stream.stop()
+            await self.writer.drain()
+
+    def serve_forever(self):
+        try:
+            asyncio.run(self.run())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.inference_pool.shutdown(wait=True)
+            self.writer.close()
+            self.db.close()
+
+
+def parse_desk(value):
+    name, sep, source = value.partition('=')
+    if not sep or not name or not source:
+        raise argparse.ArgumentTypeError("desks are given as NAME=SOURCE (camera index, video file or synthetic)")
+    return name, source
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless multi-desk posture monitoring server")
+    parser.add_argument('--desk', action='append', type=parse_desk, required=True,
+                        help="NAME=SOURCE, where SOURCE is a camera index, a video file or synthetic[:WxH@FPS] (repeatable)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=2, help="inference worker threads shared by all desks")
+    parser.add_argument('--process-width', type=int, default=640)
+    parser.add_argument('--backend', default=None,
+                        help="pose backend: mediapipe:0|1|2, landmarker:MODEL.task, landmarker-live:MODEL.task, "
+                             "dnn:MODEL.onnx or auto (default: POSE_BACKEND or mediapipe:0)")
+    parser.add_argument('--roi-tracking', action='store_true', help="run inference on a crop around the last detected pose")
+    parser.add_argument('--metrics', action='store_true', help="collect latency/FPS metrics for /metrics")
+    args = parser.parse_args()
+
+    if args.metrics:
+        metrics.enabled = True
+
+    server = MonitoringServer(args.desk, args.host, args.port, args.workers, args.process_width, args.roi_tracking,
+                              args.backend)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
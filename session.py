@@ -0,0 +1,71 @@
+import threading
+from datetime import datetime
+
+from presence import PresenceTracker
+from posture_detector import NO_PERSON_STATUS
+from wellness import WellnessTracker
+
+
+class MonitoringSession:
+    def __init__(self, database, user_id, gamification, alerts, wellness=None, presence=None):
+        self.db = database
+        self.user_id = user_id
+        self.gamification = gamification
+        self.alerts = alerts
+        self.wellness = wellness or WellnessTracker(user_id)
+        self.presence = presence or PresenceTracker()
+        self.power_settings = None
+        # the writer runs several DB calls at once; one session's writes still go one at a time
+        self.write_lock = threading.Lock()
+
+    # per-frame, in-memory side: presence, alerts and wellness metrics.
+    # Returns a (start, end) break interval when the user just came back from a break.
+    def observe(self, status, score, timestamp=None, landmarks=None, keypoints=None):
+        timestamp = timestamp or datetime.now()
+        self.wellness.update(status, score, timestamp, landmarks, keypoints)
+
+        break_interval = self.presence.update(status != NO_PERSON_STATUS, timestamp)
+        if break_interval:
+            self.alerts.reset_break_timer()
+            self.wellness.record_break(*break_interval)
+
+        if not self.presence.away and self.alerts.check_posture_alert(score):
+            self.wellness.record_alert(timestamp)
+
+        return break_interval
+
+    def should_record(self, status):
+        # an empty desk is a break, not a stream of zero-score posture records
+        return not (self.presence.away and status == NO_PERSON_STATUS)
+
+    # database side, safe to run on a worker thread
+    def record_break(self, start, end):
+        with self.write_lock:
+            return self.gamification.record_break(self.user_id, start, end)
+
+    # database side, safe to run on a worker thread
+    def record(self, status, score, timestamp=None, measurements=None):
+        if timestamp is None:
+            timestamp = datetime.now()
+
+        with self.write_lock:
+            self.db.save_posture_record(self.user_id, score, status, timestamp, measurements)
+
+            if score >= 85:
+                self.gamification.award_points(self.user_id, 'excellent_posture')
+            elif score >= 70:
+                self.gamification.award_points(self.user_id, 'good_posture')
+
+            return self.gamification.check_and_award_badges(self.user_id)
+
+    def notify_badges(self, new_badges):
+        for badge in new_badges:
+            self.alerts.show_achievement_notification(badge)
+
+    def apply_settings(self, settings):
+        settings = settings or {}
+        if 'break_interval' in settings:
+            self.alerts.set_break_interval(settings['break_interval'])
+        if 'posture_check_interval' in settings:
+            self.alerts.set_posture_check_interval(settings['posture_check_interval'])
+        self.power_settings = settings.get('power_saving')
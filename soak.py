@@ -0,0 +1,239 @@
+import argparse
+import asyncio
+import gc
+import io
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from functools import partial
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from alerts import AlertSystem
+from analytics import Analytics
+from capture import ThreadedVideoCapture
+from database import Database
+from gamification import GamificationSystem
+from orchestrator import MonitoringOrchestrator
+from posture_detector import NO_PERSON_STATUS, PostureDetector
+from reports import build_report, report_figures
+from session import MonitoringSession
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def rss_bytes():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # peak rather than current RSS, still enough to catch steady growth
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+
+class MemorySampler:
+    # RSS, tracemalloc and gc object counts, compared against a baseline taken after warm-up
+    def __init__(self, top=10, frames=1):
+        self.top = top
+        tracemalloc.start(frames)
+        self.started = time.monotonic()
+        self.baseline = None
+        self.baseline_snapshot = None
+
+    def sample(self):
+        traced, peak = tracemalloc.get_traced_memory()
+        return {
+            'elapsed_s': time.monotonic() - self.started,
+            'rss_mb': rss_bytes() / 2**20,
+            'traced_mb': traced / 2**20,
+            'traced_peak_mb': peak / 2**20,
+            'gc_counts': gc.get_count(),
+            'objects': len(gc.get_objects()),
+        }
+
+    def set_baseline(self):
+        gc.collect()
+        self.baseline = self.sample()
+        self.baseline_snapshot = tracemalloc.take_snapshot()
+        return self.baseline
+
+    def growth(self, sample):
+        if self.baseline is None:
+            return None
+        return {
+            'rss_mb': sample['rss_mb'] - self.baseline['rss_mb'],
+            'traced_mb': sample['traced_mb'] - self.baseline['traced_mb'],
+            'objects': sample['objects'] - self.baseline['objects'],
+        }
+
+    def top_allocators(self):
+        if self.baseline_snapshot is None:
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ])
+        return [str(stat) for stat in snapshot.compare_to(self.baseline_snapshot, 'lineno')[:self.top]]
+
+    def stop(self):
+        tracemalloc.stop()
+
+
+class ScriptedPresence:
+    # wraps the detector for replay sources without a person in them (synthetic:...): inference
+    # still runs on every frame, but an empty result becomes a random-walk score, so presence,
+    # posture records, points and badge checks see a seated user all run long
+    def __init__(self, detector, seed=0):
+        self.detector = detector
+        self.rng = random.Random(seed)
+        self.score = 75.0
+
+    def __getattr__(self, name):
+        return getattr(self.detector, name)
+
+    def analyze_posture(self, image, process_width=640):
+        frame, status, score = self.detector.analyze_posture(image, process_width)
+        if status != NO_PERSON_STATUS:
+            return frame, status, score
+
+        self.score = min(max(self.score + self.rng.gauss(0, 4), 0.0), 100.0)
+        score = int(self.score)
+        return frame, "Good Posture" if score >= 70 else "Poor Posture", score
+
+
+def render_reports(analytics, gamification, user_id):
+    # the stats/insights/charts refresh the desktop app runs, rendered off-screen
+    report = build_report(analytics, gamification, user_id)
+    for fig in report_figures(analytics, report):
+        FigureCanvasAgg(fig).print_png(io.BytesIO())
+
+
+async def soak(args):
+    db = Database()
+    if db.db is None:
+        raise SystemExit("Database not reachable")
+
+    user_id = str(db.create_or_get_user(args.user)['_id'])
+    gamification = GamificationSystem(db)
+    analytics = Analytics(db)
+    session = MonitoringSession(db, user_id, gamification, AlertSystem(None))
+    if not args.power_saving:
+        # full frame rate is the worst case for per-frame allocations; this only holds while
+        # the user is present, an empty desk is always throttled to the idle rate
+        session.power_settings = {'enabled': False}
+
+    detector = PostureDetector(draw_overlay=False)
+    scripted = args.scripted_scores == 'on' or (
+        args.scripted_scores == 'auto' and str(args.source).startswith('synthetic'))
+    if scripted:
+        print("Scripting a seated user: frames without a person get a random-walk posture score")
+    pipeline_detector = ScriptedPresence(detector) if scripted else detector
+    orchestrator = MonitoringOrchestrator(partial(ThreadedVideoCapture, args.source), pipeline_detector, session)
+    sampler = MemorySampler(top=args.top)
+    log = open(args.log, 'a') if args.log else None
+    loop = asyncio.get_running_loop()
+    failures = []
+
+    await orchestrator.start()
+    try:
+        next_report = 0.0
+        while True:
+            await asyncio.sleep(args.interval)
+            elapsed = time.monotonic() - sampler.started
+
+            if elapsed >= next_report:
+                await loop.run_in_executor(None, render_reports, analytics, gamification, user_id)
+                next_report = elapsed + args.report_interval
+
+            if sampler.baseline is None and elapsed >= args.warmup:
+                baseline = sampler.set_baseline()
+                print(f"[{elapsed:7.0f}s] baseline rss {baseline['rss_mb']:.1f} MB, "
+                      f"traced {baseline['traced_mb']:.1f} MB, {baseline['objects']} objects")
+                continue
+
+            sample = sampler.sample()
+            growth = sampler.growth(sample)
+            print(f"[{elapsed:7.0f}s] rss {sample['rss_mb']:.1f} MB, traced {sample['traced_mb']:.1f} MB, "
+                  f"{sample['objects']} objects, gc {sample['gc_counts']}"
+                  + (f", growth rss {growth['rss_mb']:+.1f} MB traced {growth['traced_mb']:+.1f} MB"
+                     if growth else ""))
+            if log:
+                log.write(json.dumps({**sample, 'growth': growth}) + "\n")
+                log.flush()
+
+            if growth:
+                failures = []
+                if growth['rss_mb'] > args.rss_budget_mb:
+                    failures.append(f"RSS grew {growth['rss_mb']:.1f} MB (budget {args.rss_budget_mb} MB)")
+                if growth['traced_mb'] > args.traced_budget_mb:
+                    failures.append(f"Python heap grew {growth['traced_mb']:.1f} MB "
+                                    f"(budget {args.traced_budget_mb} MB)")
+                if failures and args.fail_fast:
+                    break
+
+            if elapsed >= args.duration:
+                break
+    finally:
+        await orchestrator.stop()
+        detector.release()
+        db.close()
+        if log:
+            log.close()
+
+    if sampler.baseline is None:
+        failures.append("run ended before the warm-up finished; no baseline to compare against")
+    else:
+        print("Top allocations since baseline:")
+        for line in sampler.top_allocators():
+            print(f"  {line}")
+    sampler.stop()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test the monitoring pipeline and fail on memory growth")
+    parser.add_argument('--source', default='synthetic:640x480@30',
+                        help="replay source: video file (looped), synthetic[:WxH@FPS] or camera index")
+    parser.add_argument('--duration', type=float, default=8 * 3600, help="seconds")
+    parser.add_argument('--warmup', type=float, default=300, help="seconds before the baseline is taken")
+    parser.add_argument('--interval', type=float, default=60, help="seconds between samples")
+    parser.add_argument('--report-interval', type=float, default=300,
+                        help="seconds between analytics/stats refreshes")
+    parser.add_argument('--rss-budget-mb', type=float, default=64)
+    parser.add_argument('--traced-budget-mb', type=float, default=16)
+    parser.add_argument('--top', type=int, default=10, help="allocation sites to report")
+    parser.add_argument('--user', default='soak-test')
+    parser.add_argument('--database', default='mindful_work_desk_soak',
+                        help="database to write into; keep it away from real data")
+    parser.add_argument('--power-saving', action='store_true', help="keep the duty-cycle scheduler on")
+    parser.add_argument('--scripted-scores', choices=['auto', 'on', 'off'], default='auto',
+                        help="replace 'no person' results with a scripted seated user so records, points "
+                             "and badges keep flowing (auto: only for synthetic sources)")
+    parser.add_argument('--fail-fast', action='store_true', help="stop as soon as a budget is exceeded")
+    parser.add_argument('--log', help="append samples as JSON lines to this file")
+    args = parser.parse_args()
+
+    os.environ['DATABASE_NAME'] = args.database
+    failures = asyncio.run(soak(args))
+    if failures:
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        sys.exit(1)
+    print("PASS: memory stayed within budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import math
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+
+from posture_detector import NO_PERSON_STATUS
+
+
+class _Bucket:
+    __slots__ = ('start', 'sitting_seconds', 'eye_rest_seconds', 'time_since_break_seconds',
+                 'score_count', 'score_mean', 'score_m2', 'alerts', 'complied')
+
+    def __init__(self, start):
+        self.start = start
+        self.sitting_seconds = 0.0
+        self.eye_rest_seconds = 0.0
+        self.time_since_break_seconds = 0.0
+        self.score_count = 0
+        self.score_mean = 0.0
+        self.score_m2 = 0.0
+        self.alerts = 0
+        self.complied = 0
+
+    def add_score(self, score):
+        # Welford's online variance, so the stream is read once and never stored
+        self.score_count += 1
+        delta = score - self.score_mean
+        self.score_mean += delta / self.score_count
+        self.score_m2 += delta * (score - self.score_mean)
+
+    def score_std(self):
+        if self.score_count < 2:
+            return 0.0
+        return math.sqrt(self.score_m2 / (self.score_count - 1))
+
+
+class WellnessTracker:
+    # derives per-session wellness metrics from the posture stream in a single pass and
+    # emits them as time-bucketed wellness_metrics documents
+    def __init__(self, user_id, bucket_seconds=300, max_gap_seconds=5,
+                 compliance_window_seconds=60, eye_visibility=0.5, good_score=70, session_id=None):
+        self.user_id = user_id
+        # part of each bucket's key, so another session (a restart, or the server and the
+        # desktop app watching one user) writes its own documents instead of overwriting these
+        self.session_id = session_id or uuid.uuid4().hex
+        self.bucket_seconds = bucket_seconds
+        self.max_gap_seconds = max_gap_seconds
+        self.compliance_window = timedelta(seconds=compliance_window_seconds)
+        self.eye_visibility = eye_visibility
+        self.good_score = good_score
+
+        self.buckets = {}
+        self.dirty = set()
+        self.flushing = set()
+        self.pending_alerts = deque()
+        self.last_timestamp = None
+        self.last_break_end = None
+        self.breaks = []
+
+    def _bucket(self, timestamp):
+        epoch = timestamp.timestamp()
+        start = datetime.fromtimestamp(epoch - epoch % self.bucket_seconds)
+        bucket = self.buckets.get(start)
+        if bucket is None:
+            bucket = self.buckets[start] = _Bucket(start)
+        self.dirty.add(start)
+        return bucket
+
+    def update(self, status, score, timestamp=None, landmarks=None, keypoints=None):
+        timestamp = timestamp or datetime.now()
+        if self.last_break_end is None:
+            self.last_break_end = timestamp
+
+        dt = 0.0
+        if self.last_timestamp is not None:
+            dt = min(max((timestamp - self.last_timestamp).total_seconds(), 0.0), self.max_gap_seconds)
+        self.last_timestamp = timestamp
+
+        bucket = self._bucket(timestamp)
+        present = status != NO_PERSON_STATUS
+
+        if present:
+            bucket.sitting_seconds += dt
+            if score > 0:
+                bucket.add_score(score)
+            if landmarks is not None and keypoints and not self._eyes_on_screen(landmarks, keypoints):
+                bucket.eye_rest_seconds += dt
+
+        bucket.time_since_break_seconds = (timestamp - self.last_break_end).total_seconds()
+        self._update_compliance(timestamp, score)
+
+    def _eyes_on_screen(self, landmarks, keypoints):
+        # pose models give no eyelids, so "both eyes hidden from the camera" stands in for eye rest
+        eyes = [keypoints[name] for name in ('left_eye', 'right_eye') if name in keypoints]
+        if not eyes:
+            return True
+        return any(landmarks[index].visibility >= self.eye_visibility for index in eyes)
+
+    def _update_compliance(self, timestamp, score):
+        while self.pending_alerts and timestamp - self.pending_alerts[0] > self.compliance_window:
+            self.pending_alerts.popleft()
+
+        if score >= self.good_score:
+            while self.pending_alerts:
+                alert_time = self.pending_alerts.popleft()
+                self._bucket(alert_time).complied += 1
+
+    def record_alert(self, timestamp=None):
+        timestamp = timestamp or datetime.now()
+        self._bucket(timestamp).alerts += 1
+        self.pending_alerts.append(timestamp)
+
+    def record_break(self, start, end):
+        self.breaks.append((start, end))
+        self.last_break_end = end
+        del self.breaks[:-50]
+
+    def collect(self):
+        docs = []
+        for start in sorted(self.dirty):
+            bucket = self.buckets[start]
+            values = {
+                'sitting_seconds': bucket.sitting_seconds,
+                'time_since_break_seconds': bucket.time_since_break_seconds,
+                'eye_rest_seconds': bucket.eye_rest_seconds,
+                'posture_variability': bucket.score_std(),
+            }
+            if bucket.alerts:
+                values['alert_compliance'] = bucket.complied / bucket.alerts
+
+            for metric_type, value in values.items():
+                docs.append({
+                    'user_id': self.user_id,
+                    'session_id': self.session_id,
+                    'metric_type': metric_type,
+                    'timestamp': start,
+                    'bucket_seconds': self.bucket_seconds,
+                    'value': value,
+                    'samples': bucket.score_count,
+                })
+        # held until the write is confirmed, see flushed()
+        self.flushing |= self.dirty
+        self.dirty.clear()
+        return docs
+
+    def flushed(self, ok):
+        if not ok:
+            # the write failed; the buckets go out again with the next flush
+            self.dirty |= self.flushing
+            self.flushing.clear()
+            return
+        self.flushing.clear()
+
+        # buckets that can no longer receive data (or late compliance) are dropped from memory
+        if self.last_timestamp is not None:
+            horizon = self.last_timestamp - self.compliance_window - timedelta(seconds=self.bucket_seconds)
+            for start in [s for s in self.buckets if s < horizon and s not in self.dirty]:
+                del self.buckets[start]